@@ -0,0 +1,213 @@
+import itertools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# LIMIT のない SELECT の扱い
+UNBOUNDED_OFF = "off"
+UNBOUNDED_LIMIT = "limit"
+UNBOUNDED_REJECT = "reject"
+
+# 文字列リテラル、IRI、コメント(LIMIT の判定から除く)
+_IGNORE_RE = re.compile(
+    r'"""(?:[^"\\]|\\.|"(?!""))*"""'
+    r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+    r'|"(?:[^"\\\n]|\\.)*"'
+    r"|'(?:[^'\\\n]|\\.)*'"
+    r'|<[^<>"{}|^`\\\s]*>'
+    r'|#[^\n]*')
+_PROLOGUE_RE = re.compile(r'^\s*(?:(?:PREFIX\s+[^\s:]*:\s*|BASE\s+)_+\s*)*', re.IGNORECASE)
+_LIMIT_RE = re.compile(r'\bLIMIT\s+\d+', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\b', re.IGNORECASE)
+
+
+class AdmissionRejected(Exception):
+    """クエリを受け付けられない(status_code で返却する)"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def _blank(query: str) -> str:
+    """リテラルと IRI を _ に、コメントを空白に置き換える(位置は元のクエリと同じ)"""
+    return _IGNORE_RE.sub(
+        lambda m: (' ' if m.group(0).startswith('#') else '_') * len(m.group(0)), query)
+
+
+def _limit_position(query: str) -> Optional[int]:
+    """最上位に LIMIT のない SELECT の場合は LIMIT を挿入する位置を返却する(それ以外は None)"""
+    text = _blank(query)
+    start = _PROLOGUE_RE.match(text).end()
+    if text[start:start + 6].upper() != 'SELECT':
+        return None
+    # WHERE 句(最上位の最初の {...})の終わりを探す
+    depth = 0
+    end = None
+    for i in range(start, len(text)):
+        if text[i] == '{':
+            depth += 1
+        elif text[i] == '}':
+            depth -= 1
+            if depth == 0:
+                end = i + 1
+                break
+    if end is None:
+        return None
+    # 解の修飾子(ORDER BY / LIMIT / OFFSET)は WHERE 句の後、末尾の VALUES より前に書かれる
+    values = _VALUES_RE.search(text, end)
+    tail_end = values.start() if values else len(text)
+    if _LIMIT_RE.search(text, end, tail_end):
+        return None
+    return tail_end
+
+
+def is_unbounded_select(query: str) -> bool:
+    """最上位に LIMIT のない SELECT か判定する"""
+    return _limit_position(query) is not None
+
+
+class AdmissionControl:
+    """グラフDBへのクエリの流量制御
+
+    * クライアント(client_limits に登録された API キー、それ以外は接続元アドレス) 毎の同時リクエスト数を制限し、
+      超えた場合は 429 で拒否する
+    * グラフDBへ同時に転送するクエリ数を max_concurrency に制限し、空きを待つクエリが max_queue を超えた場合、
+      または queue_timeout 秒待っても空かない場合は 503 で拒否する
+    * 空きを待つクエリがある場合は、転送中のクエリが最も少ないクライアントのクエリから転送する
+    * LIMIT のない SELECT は、設定に応じて LIMIT を付与するか 400 で拒否する
+
+    登録されていない API キーはクライアントの識別に使わないため、キーを変えても制限は回避できない。
+    一つのクライアントが待ち行列に入れるクエリは同時リクエスト数までとなり、空きは転送中のクエリが少ないクライアントから
+    割り当てるため、一部のクライアントが大量のクエリを発行しても、他のクライアントのクエリが先に転送される。
+    """
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.max_concurrency = 8
+        self.max_queue = 32
+        self.queue_timeout = 10.0
+        self.client_concurrency = 4
+        # API キー毎の同時リクエスト数(client_concurrency より優先する)
+        self.client_limits: Dict[str, int] = {}
+        self.unbounded_select = UNBOUNDED_OFF
+        self.default_limit = 10000
+        self.active = 0
+        # 空きを待つクエリ(クライアント, 到着順)
+        self.queue: List[Tuple[str, int]] = []
+        self._seq = itertools.count()
+        # クライアント毎の同時リクエスト数と、グラフDBへ転送中のクエリ数
+        self.clients: Dict[str, int] = {}
+        self.upstream_clients: Dict[str, int] = {}
+        self.stats = {
+            'admitted': 0,
+            'rejected_client': 0,
+            'rejected_queue_full': 0,
+            'rejected_timeout': 0,
+            'rejected_unbounded': 0,
+            'limit_injected': 0,
+        }
+
+    def configure(self, config):
+        """app_link の config.ini の [admission] セクションを反映する"""
+        section = 'admission'
+        self.max_concurrency = config.getint(section, 'max_concurrency', fallback=self.max_concurrency)
+        self.max_queue = config.getint(section, 'max_queue', fallback=self.max_queue)
+        self.queue_timeout = config.getfloat(section, 'queue_timeout', fallback=self.queue_timeout)
+        self.client_concurrency = config.getint(section, 'client_concurrency', fallback=self.client_concurrency)
+        limits = config.get(section, 'client_limits', fallback='')
+        self.client_limits = {
+            key.strip(): int(limit)
+            for key, limit in (item.rsplit(':', 1) for item in limits.split(',') if item.strip())}
+        self.unbounded_select = config.get(section, 'unbounded_select', fallback=self.unbounded_select)
+        self.default_limit = config.getint(section, 'default_limit', fallback=self.default_limit)
+
+    def check_query(self, query: str) -> str:
+        """LIMIT のない SELECT に LIMIT を付与したクエリを返却する(拒否する設定の場合は AdmissionRejected を送出する)"""
+        if self.unbounded_select == UNBOUNDED_OFF:
+            return query
+        position = _limit_position(query)
+        if position is None:
+            return query
+        if self.unbounded_select == UNBOUNDED_REJECT:
+            with self.lock:
+                self.stats['rejected_unbounded'] += 1
+            raise AdmissionRejected(400, 'SELECT query without LIMIT is not allowed')
+        with self.lock:
+            self.stats['limit_injected'] += 1
+        # 末尾に VALUES がある場合は、その前に LIMIT を付与する
+        return f"{query[:position].rstrip()}\nLIMIT {self.default_limit}\n{query[position:]}".rstrip()
+
+    def identify(self, api_key: Optional[str], remote_addr: str) -> str:
+        """クライアントの識別子を返却する(client_limits に登録されていない API キーは接続元アドレスとして扱う)"""
+        if api_key and api_key in self.client_limits:
+            return f'key:{api_key}'
+        return f'addr:{remote_addr}'
+
+    @contextmanager
+    def client(self, client_id: str, api_key: Optional[str] = None):
+        """クライアント毎の同時リクエスト数の制限"""
+        limit = self.client_limits.get(api_key, self.client_concurrency) if api_key else self.client_concurrency
+        with self.lock:
+            count = self.clients.get(client_id, 0)
+            if count >= limit:
+                self.stats['rejected_client'] += 1
+                raise AdmissionRejected(429, 'Too many concurrent queries for this client')
+            self.clients[client_id] = count + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.clients[client_id] -= 1
+                if self.clients[client_id] == 0:
+                    del self.clients[client_id]
+
+    def _next(self) -> Tuple[str, int]:
+        """次に転送する待ちクエリ(転送中のクエリが最も少ないクライアントの、最も早く到着したもの)"""
+        return min(self.queue, key=lambda ticket: (self.upstream_clients.get(ticket[0], 0), ticket[1]))
+
+    @contextmanager
+    def upstream(self, client_id: str = ''):
+        """グラフDBへ同時に転送するクエリ数の制限"""
+        with self.lock:
+            if self.active >= self.max_concurrency or self.queue:
+                if len(self.queue) >= self.max_queue:
+                    self.stats['rejected_queue_full'] += 1
+                    raise AdmissionRejected(503, 'Query queue is full')
+                ticket = (client_id, next(self._seq))
+                self.queue.append(ticket)
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.active >= self.max_concurrency or self._next() is not ticket:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.stats['rejected_timeout'] += 1
+                            raise AdmissionRejected(503, 'Timed out waiting for a query slot')
+                        self.lock.wait(remaining)
+                finally:
+                    self.queue.remove(ticket)
+                    # 次の待ちクエリが転送できるようになったか確認させる
+                    self.lock.notify_all()
+            self.active += 1
+            self.upstream_clients[client_id] = self.upstream_clients.get(client_id, 0) + 1
+            self.stats['admitted'] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.upstream_clients[client_id] -= 1
+                if self.upstream_clients[client_id] == 0:
+                    del self.upstream_clients[client_id]
+                self.lock.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, active=self.active, waiting=len(self.queue), clients=dict(self.clients))
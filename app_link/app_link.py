@@ -1,22 +1,30 @@
-from design_support import design_support
-
-from flask import Flask, request, jsonify
-from sparql import query
-
 import configparser
+import itertools
 import json
 import logging
 import os
 import sys
 import threading
+from datetime import datetime, timezone
 from pathlib import Path
 
 
 sys.path.append(os.path.join(Path().resolve(), os.pardir, 'crawler'))
 
+from design_support import design_support
+
+from flask import Flask, Response, request, jsonify
+from requests.exceptions import Timeout
+from admission import AdmissionControl, AdmissionRejected
+from sparql import query
+
 from PlanedEndPointListClass import PlanedEndPointListClass
-from EndPointListClass import EndPointListClass
-from CrawlingData import Crawling
+from EndPointListClass import INTERACTIVE, LANES, EndPointListClass
+from CrawlingData import (
+    Crawling, get_bulk_loader, get_change_log, get_config, get_cycle_profiler, get_endpoint_resolver,
+    get_stage_timings, get_summary_index)
+from lib_changefeed import InvalidCursor
+from lib_singleflight import SingleFlight, normalize_query
 
 
 logger = logging.getLogger(__name__)
@@ -25,6 +33,24 @@ app = Flask(__name__)
 config = configparser.ConfigParser()
 planed_end_point_list = PlanedEndPointListClass()
 end_point_list = EndPointListClass()
+# 同じクエリの同時実行をまとめる
+single_flight = SingleFlight()
+# グラフDBへのクエリの流量制御
+admission = AdmissionControl()
+
+
+def query_graphdb(query_sql: str, client_id: str = ''):
+    """グラフDBへ検索する(ローカルのレプリカが設定されている場合はレプリカから検索し、失敗した場合はグラフDBから検索する)"""
+    replica = config["sparql"].get("replica")
+    decoder = config["sparql"].get("decoder", "auto")
+    timeout = config["sparql"].getfloat("timeout", 30.0)
+    with admission.upstream(client_id):
+        if replica:
+            try:
+                return query(replica, query_sql, decoder, timeout)
+            except Exception as e:
+                logger.warning(f"replica query failed {str(e)}")
+        return query(config["sparql"]["endpoint"], query_sql, decoder, timeout)
 
 
 @app.route('/v1/api/sendQuery', methods=['POST'])
@@ -54,7 +80,22 @@ def send_query():
     # if 'query' not in body:
         # return jsonify({'message': 'Invalid missing query parameter'}), 400
     # query_sql = body['query']
-    res = query(config["sparql"]["endpoint"], query_sql)
+    # クライアント(登録された API キー、なければ接続元アドレス)毎の同時リクエスト数を制限する
+    api_key = request.headers.get('X-API-Key')
+    client_id = admission.identify(api_key, request.remote_addr)
+    try:
+        with admission.client(client_id, api_key):
+            # LIMIT のない SELECT は、設定に応じて LIMIT を付与するか拒否する
+            query_sql = admission.check_query(query_sql)
+            # 同じクエリ・Accept のリクエストが実行中であれば、グラフDBへは転送せずにその結果を共有する
+            key = (normalize_query(query_sql), request.headers.get('Accept', ''))
+            res, shared = single_flight.do(key, lambda: query_graphdb(query_sql, client_id))
+            logger.info(f'{shared=}')
+    except AdmissionRejected as e:
+        logger.warning(f'query rejected {client_id=} {e.message}')
+        return jsonify({'message': e.message}), e.status_code
+    except Timeout:
+        return jsonify({'message': 'Graph database query timed out'}), 504
 
     # 設計支援システムへ送信
     try:
@@ -66,10 +107,85 @@ def send_query():
     return res  # 200 Success
 
 
+@app.route('/v1/api/queryStats', methods=['GET'])
+def query_stats():
+    """グラフDBへ転送したクエリ数と、実行中のクエリの結果を共有したクエリ数を返却する"""
+    return jsonify(dict(single_flight.get_stats(), admission=admission.get_stats()))
+
+
 @app.route('/v1/api/getLastModify', methods=['GET'])
 def get_last_modify():
+    """最終クロール日時を返却する(domain を指定した場合はそのドメインの最終クロール日時)"""
     logger.info('get_last_modify()')
-    return "2025-01-24T14:30:00Z"
+    domain = request.args.get('domain')
+    last_modified = get_change_log(get_config()).last_modified(domain)
+    if last_modified is None:
+        return jsonify({'message': 'Not crawled yet'}), 404
+    return last_modified
+
+
+@app.route('/v1/api/changes', methods=['GET'])
+def changes():
+    """カーソル以降のグラフDBの変更履歴を NDJSON で返却する
+
+    各レコードの cursor を次回の since に指定すると、そのレコードより後の変更のみ取得できる
+    """
+    logger.info('changes()')
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'message': 'Invalid since parameter'}), 400
+    records = get_change_log(get_config()).read_since(since, request.args.get('domain'))
+    # カーソルの検証のため、最初のレコードは応答の前に読み込む
+    try:
+        first = next(records, None)
+    except InvalidCursor as e:
+        return jsonify({'message': str(e)}), 400
+
+    def generate():
+        if first is None:
+            return
+        for cursor, record in itertools.chain([first], records):
+            yield json.dumps({'cursor': cursor, **json.loads(record)}, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+
+@app.route('/v1/api/summary', methods=['GET'])
+def summary():
+    """ドメイン毎のトリプル数などの集計を返却する(domain を指定した場合はそのドメインの集計の詳細)"""
+    logger.info('summary()')
+    index = get_summary_index(get_config())
+    domain = request.args.get('domain')
+    if not domain:
+        return jsonify(index.overview())
+    summary = index.domain(domain)
+    if summary is None:
+        return jsonify({'message': 'Domain is not crawled yet'}), 404
+    return jsonify(summary)
+
+
+@app.route('/v1/api/summaryLinks', methods=['GET'])
+def summary_links():
+    """ドメイン間のリンクの一覧を返却する"""
+    logger.info('summaryLinks()')
+    return jsonify(get_summary_index(get_config()).links())
+
+
+@app.route('/v1/api/bulkLoads', methods=['GET'])
+def bulk_loads():
+    """ドメイン毎の直近のバルクロードの結果を返却する"""
+    logger.info('bulkLoads()')
+    loader = get_bulk_loader(get_config())
+    return jsonify(loader.get_results() if loader is not None else {})
+
+
+@app.route('/v1/api/discovery', methods=['GET'])
+def discovery():
+    """ディスカバリーファインダーへの問い合わせ件数と、キャッシュしている解決済みのエンドポイントを返却する"""
+    logger.info('discovery()')
+    resolver = get_endpoint_resolver(get_config())
+    return jsonify(dict(resolver.get_stats(), endpoints=resolver.get_endpoints()))
 
 
 @app.route('/v1/api/sendEndpointList', methods=['POST'])
@@ -81,13 +197,98 @@ def subscription():
     if 'endpoint_list' not in body:
         return jsonify({'message': 'Invalid missing endpoint parameter'}), 400
 
+    # 利用者が登録したエンドポイントは、定期的な再クロールより優先してクロールする
+    priority = body.get('priority', INTERACTIVE)
+    if priority not in LANES:
+        return jsonify({'message': f'Invalid priority parameter. Must be one of: {list(LANES)}'}), 400
+
     elist = body['endpoint_list']
-    end_point_list.conbine(elist)
+    end_point_list.conbine(elist, priority)
     logger.info(f'{end_point_list.get()=}')
 
     return ""  # 200 Success
 
 
+@app.route('/v1/api/queuePosition', methods=['GET'])
+def queue_position():
+    """クローリング待ちのエンドポイントの順番と開始予定時刻を返却する"""
+    logger.info('queuePosition()')
+    endpoint = request.args.get('endpoint')
+    if not endpoint:
+        return jsonify({'message': 'Invalid missing endpoint parameter'}), 400
+
+    position = end_point_list.position(endpoint)
+    if position is None:
+        return jsonify({'message': 'Endpoint is not queued'}), 404
+    for key in ('started_at', 'estimated_start'):
+        if key in position:
+            position[key] = datetime.fromtimestamp(position[key], timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return jsonify(position)
+
+
+def admin_forbidden():
+    """管理APIの API キー([admin] api_key) が設定されていれば、X-API-Key ヘッダーと一致しない場合に 403 を返却する"""
+    api_key = config.get('admin', 'api_key', fallback='')
+    if api_key and request.headers.get('X-API-Key') != api_key:
+        return jsonify({'message': 'Forbidden'}), 403
+    return None
+
+
+@app.route('/v1/api/admin/profile', methods=['POST'])
+def arm_profile():
+    """次のクロール周期(scope=domain の場合は domain のクロール)のプロファイリングを予約する
+
+    プロファイラ(profiler=sampling / cprofile)と tracemalloc(tracemalloc=true / false)の結果は、
+    クローラの PROFILE_DIR 配下にクロール周期ID毎に書き出す
+    """
+    logger.info('arm_profile()')
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    body = request.get_json(silent=True) or {}
+    try:
+        armed = get_cycle_profiler().arm(
+            body.get('scope', 'cycle'), body.get('domain'),
+            body.get('profiler', 'sampling'), bool(body.get('tracemalloc', True)))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify(armed), 202
+
+
+@app.route('/v1/api/admin/profile', methods=['GET'])
+def get_profile():
+    """プロファイリングの予約・実行状況と、クロール周期ID毎のプロファイリング結果を返却する"""
+    logger.info('get_profile()')
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    profiler = get_cycle_profiler()
+    return jsonify(dict(profiler.get_state(), reports=profiler.list_reports()))
+
+
+@app.route('/v1/api/admin/profile', methods=['DELETE'])
+def disarm_profile():
+    """プロファイリングの予約を取り消す(実行中のプロファイリングは止めない)"""
+    logger.info('disarm_profile()')
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    armed = get_cycle_profiler().disarm()
+    if armed is None:
+        return jsonify({'message': 'Profiling is not armed'}), 404
+    return jsonify(armed)
+
+
+@app.route('/v1/api/admin/stageTimings', methods=['GET'])
+def stage_timings():
+    """クロール周期毎のステージ(スケジューラ待ち、取得、解析、登録、パブリッシュ)の処理時間を返却する"""
+    logger.info('stage_timings()')
+    forbidden = admin_forbidden()
+    if forbidden:
+        return forbidden
+    return jsonify(get_stage_timings().get())
+
+
 def start_crawler():
     logger.info('start_crawler()')
     Crawling(end_point_list, planed_end_point_list)
@@ -97,6 +298,7 @@ if __name__ == "__main__":
     logging.basicConfig(filename='app_link.log', level=logging.INFO)
 
     config.read("config.ini")
+    admission.configure(config)
     threading.Thread(target=start_crawler).start()
 
     app.run(port=8081, host='0.0.0.0', debug=True)
@@ -1,25 +1,36 @@
 import logging
 import requests
 
+from lib_graphstore import is_remote, open_store
+from lib_sparql_results import get_decoder
+
 
 logger = logging.getLogger(__name__)
 
 
-def query(endpoint_url: str, sql: str):
+def query(endpoint_url: str, sql: str, decoder: str = "auto", timeout: float = 30.0):
     """ GraphDB(AWS neptune) への query
+
+    検索結果は decoder (auto / orjson / msgspec / json) で指定したバックエンドでデコードする
+    timeout 秒以内に応答がない場合は requests.exceptions.Timeout を送出する
     """
     logger.info(f"query {endpoint_url}")
 
+    # SPARQLエンドポイント以外(インメモリ・組み込みのグラフDB)はプロセス内で検索する
+    if not is_remote(endpoint_url):
+        return open_store(endpoint_url).query(sql)
+
     return_format = 'json'
     headers = {
         'Content-Type': 'application/sparql',
         'Accept': f'application/sparql-results+{return_format}'
     }
     response = requests.get(
-        endpoint_url, params={'query': sql}, headers=headers)
+        endpoint_url, params={'query': sql}, headers=headers, timeout=timeout)
     if response.status_code == 200:
         logger.info(f"{response.text}")
-        return response.json()
+        return get_decoder(decoder).decode(
+            response.content, response.headers.get('Content-Type'))
 
     # TODO: エラー処理
     logger.error(f"ERROR {response.text=}")
@@ -27,7 +27,7 @@ from rdflib import Graph, URIRef, Literal, Namespace
 from rdflib.namespace import RDF, RDFS, XSD
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from pathlib import Path
 import configparser
 import requests
@@ -40,9 +40,21 @@ import urllib
 import copy
 import logging
 
+from lib_bulkload import LOAD_COMPLETED, BulkLoader
+from lib_bulkload import iter_staging_bindings
+from lib_changefeed import ChangeLog, DomainChangeset
+from lib_discovery import EndpointResolver
+from lib_summary import SummaryIndex
+from lib_checkpoint import CrawlCheckpoint
+from lib_graphstore import GraphStore, ReplicatedStore, open_store
+from lib_pipeline import DeadlineExceeded, DomainPipeline
+from lib_profiling import CycleProfiler, StageTimings
 from PlanedEndPointListClass import PlanedEndPointListClass
-from EndPointListClass import EndPointListClass
+from EndPointListClass import BACKGROUND, INTERACTIVE, EndPointListClass
 from lib_publish import PublishUtil
+from lib_resilience import CircuitOpenError, OperatorClient
+from lib_shard import ShardedCrawler
+from lib_sparql_results import ACCEPT, get_decoder, iter_ntriples_bindings
 
 
 logger = logging.getLogger(__name__)
@@ -76,11 +88,57 @@ def get_config(config_path_str: str = "./config.ini") -> dict:
             
         # 環境変数が設定されていない場合は設定ファイルの値を使用
         discovery_finder_url = config_dict.get('DISCOVERY_FINDER_URL')
+        discovery_service_domain = config_dict.get('DISCOVERY_SERVICE_DOMAIN', '')
+        discovery_resolve_path = config_dict.get('DISCOVERY_RESOLVE_PATH', '/v1/api/endpoints')
+        discovery_cache_ttl = config_dict.get('DISCOVERY_CACHE_TTL', '3600')
+        discovery_negative_ttl = config_dict.get('DISCOVERY_NEGATIVE_TTL', '300')
+        discovery_timeout = config_dict.get('DISCOVERY_TIMEOUT', '5')
+        discovery_workers = config_dict.get('DISCOVERY_WORKERS', '8')
         crawling_interval = config_dict.get('CRAWLING_INTERVAL')
         graphdb_read_url = config_dict.get('GRAPHDB_READ_URL')
         graphdb_insert_url = config_dict.get('GRAPHDB_INSERT_URL')
+        graphdb_replica_url = config_dict.get('GRAPHDB_REPLICA_URL', '')
+        insert_batch_size = config_dict.get('INSERT_BATCH_SIZE', '500')
+        pipeline_chunk_size = config_dict.get('PIPELINE_CHUNK_SIZE', '65536')
+        pipeline_queue_size = config_dict.get('PIPELINE_QUEUE_SIZE', '16')
+        sparql_decoder = config_dict.get('SPARQL_DECODER', 'auto')
+        sparql_decoder_buffer = config_dict.get('SPARQL_DECODER_BUFFER', '67108864')
         last_updated = config_dict.get('LAST_UPDATED')
         monitor_interval = config_dict.get('MONITOR_INTERVAL')
+        crawl_shards = config_dict.get('CRAWL_SHARDS', '1')
+        crawl_nodes = config_dict.get('CRAWL_NODES', '')
+        crawl_node_self = config_dict.get('CRAWL_NODE_SELF', '')
+        rate_limit_per_sec = config_dict.get('RATE_LIMIT_PER_SEC', '5')
+        rate_limit_burst = config_dict.get('RATE_LIMIT_BURST', '10')
+        http_connect_timeout = config_dict.get('HTTP_CONNECT_TIMEOUT', '5')
+        http_read_timeout = config_dict.get('HTTP_READ_TIMEOUT', '60')
+        crawl_domain_timeout = config_dict.get('CRAWL_DOMAIN_TIMEOUT', '1800')
+        circuit_failure_threshold = config_dict.get('CIRCUIT_FAILURE_THRESHOLD', '3')
+        circuit_reset_timeout = config_dict.get('CIRCUIT_RESET_TIMEOUT', '300')
+        checkpoint_path = config_dict.get('CHECKPOINT_PATH', './checkpoint.json')
+        checkpoint_interval = config_dict.get('CHECKPOINT_INTERVAL', '10')
+        bulkload_loader_url = config_dict.get('BULKLOAD_LOADER_URL', '')
+        bulkload_threshold = config_dict.get('BULKLOAD_THRESHOLD', '100000')
+        bulkload_staging_dir = config_dict.get('BULKLOAD_STAGING_DIR', './bulkload')
+        bulkload_source_prefix = config_dict.get('BULKLOAD_SOURCE_PREFIX', '')
+        bulkload_format = config_dict.get('BULKLOAD_FORMAT', 'ntriples')
+        bulkload_iam_role_arn = config_dict.get('BULKLOAD_IAM_ROLE_ARN', '')
+        bulkload_region = config_dict.get('BULKLOAD_REGION', '')
+        bulkload_poll_interval = config_dict.get('BULKLOAD_POLL_INTERVAL', '5')
+        bulkload_timeout = config_dict.get('BULKLOAD_TIMEOUT', '3600')
+        queue_aging = config_dict.get('QUEUE_AGING', '600')
+        queue_default_duration = config_dict.get('QUEUE_DEFAULT_DURATION', '30')
+        queue_ewma_alpha = config_dict.get('QUEUE_EWMA_ALPHA', '0.3')
+        changelog_path = config_dict.get('CHANGELOG_PATH', './changes.jsonl')
+        changelog_snapshot_dir = config_dict.get('CHANGELOG_SNAPSHOT_DIR', './snapshots')
+        changelog_record_size = config_dict.get('CHANGELOG_RECORD_SIZE', '10000')
+        summary_path = config_dict.get('SUMMARY_PATH', './summary.json')
+        summary_latest_size = config_dict.get('SUMMARY_LATEST_SIZE', '20')
+        profile_dir = config_dict.get('PROFILE_DIR', './profiles')
+        profile_sample_interval = config_dict.get('PROFILE_SAMPLE_INTERVAL', '0.005')
+        profile_tracemalloc_frames = config_dict.get('PROFILE_TRACEMALLOC_FRAMES', '10')
+        profile_top = config_dict.get('PROFILE_TOP', '30')
+        stage_timings_history = config_dict.get('STAGE_TIMINGS_HISTORY', '20')
         
         # if DEBUG:
         #     # 取得した値を出力
@@ -92,11 +150,57 @@ def get_config(config_path_str: str = "./config.ini") -> dict:
             
         return {
             'DISCOVERY_FINDER_URL': discovery_finder_url,
+            'DISCOVERY_SERVICE_DOMAIN': discovery_service_domain,
+            'DISCOVERY_RESOLVE_PATH': discovery_resolve_path,
+            'DISCOVERY_CACHE_TTL': discovery_cache_ttl,
+            'DISCOVERY_NEGATIVE_TTL': discovery_negative_ttl,
+            'DISCOVERY_TIMEOUT': discovery_timeout,
+            'DISCOVERY_WORKERS': discovery_workers,
             'CRAWLING_INTERVAL': crawling_interval,
             'GRAPHDB_READ_URL': graphdb_read_url,
             'GRAPHDB_INSERT_URL': graphdb_insert_url,
+            'GRAPHDB_REPLICA_URL': graphdb_replica_url,
+            'INSERT_BATCH_SIZE': insert_batch_size,
+            'PIPELINE_CHUNK_SIZE': pipeline_chunk_size,
+            'PIPELINE_QUEUE_SIZE': pipeline_queue_size,
+            'SPARQL_DECODER': sparql_decoder,
+            'SPARQL_DECODER_BUFFER': sparql_decoder_buffer,
             'LAST_UPDATED': last_updated,
-            'MONITOR_INTERVAL': monitor_interval
+            'MONITOR_INTERVAL': monitor_interval,
+            'CRAWL_SHARDS': crawl_shards,
+            'CRAWL_NODES': crawl_nodes,
+            'CRAWL_NODE_SELF': crawl_node_self,
+            'RATE_LIMIT_PER_SEC': rate_limit_per_sec,
+            'RATE_LIMIT_BURST': rate_limit_burst,
+            'HTTP_CONNECT_TIMEOUT': http_connect_timeout,
+            'HTTP_READ_TIMEOUT': http_read_timeout,
+            'CRAWL_DOMAIN_TIMEOUT': crawl_domain_timeout,
+            'CIRCUIT_FAILURE_THRESHOLD': circuit_failure_threshold,
+            'CIRCUIT_RESET_TIMEOUT': circuit_reset_timeout,
+            'CHECKPOINT_PATH': checkpoint_path,
+            'CHECKPOINT_INTERVAL': checkpoint_interval,
+            'BULKLOAD_LOADER_URL': bulkload_loader_url,
+            'BULKLOAD_THRESHOLD': bulkload_threshold,
+            'BULKLOAD_STAGING_DIR': bulkload_staging_dir,
+            'BULKLOAD_SOURCE_PREFIX': bulkload_source_prefix,
+            'BULKLOAD_FORMAT': bulkload_format,
+            'BULKLOAD_IAM_ROLE_ARN': bulkload_iam_role_arn,
+            'BULKLOAD_REGION': bulkload_region,
+            'BULKLOAD_POLL_INTERVAL': bulkload_poll_interval,
+            'BULKLOAD_TIMEOUT': bulkload_timeout,
+            'QUEUE_AGING': queue_aging,
+            'QUEUE_DEFAULT_DURATION': queue_default_duration,
+            'QUEUE_EWMA_ALPHA': queue_ewma_alpha,
+            'CHANGELOG_PATH': changelog_path,
+            'CHANGELOG_SNAPSHOT_DIR': changelog_snapshot_dir,
+            'CHANGELOG_RECORD_SIZE': changelog_record_size,
+            'SUMMARY_PATH': summary_path,
+            'SUMMARY_LATEST_SIZE': summary_latest_size,
+            'PROFILE_DIR': profile_dir,
+            'PROFILE_SAMPLE_INTERVAL': profile_sample_interval,
+            'PROFILE_TRACEMALLOC_FRAMES': profile_tracemalloc_frames,
+            'PROFILE_TOP': profile_top,
+            'STAGE_TIMINGS_HISTORY': stage_timings_history
         }
         
 # ホワイトリストから、クローリング対象のドメイン名一覧を取得する
@@ -117,6 +221,12 @@ def get_domain_name(url: str) -> str:
     return u.netloc
 
 
+# チェックポイントファイルのパスを取得する
+def get_checkpoint_path(config: dict) -> str:
+    dirname = os.path.dirname(__file__)
+    return os.path.join(dirname, config['CHECKPOINT_PATH'])
+
+
 # ドメイン名からSPARQLクエリ用のエンドポイントを取得する
 def get_endpoint(domain: str, place_holder: str = "api/sparql/query") -> str:
     return f"http://{domain}/{place_holder}"
@@ -128,6 +238,117 @@ def get_last_updated_url(airway_operator_url: str) -> str:
     return f"http://{domain}/api/metadata/last-modified"
 
 
+# ディスカバリーファインダーによるエンドポイント解決(解決結果のキャッシュを保持するため、設定が変わるまで使い回す)
+_endpoint_resolver = None
+
+
+# 設定ファイルの内容を反映したエンドポイント解決を取得する
+def get_endpoint_resolver(config: dict) -> EndpointResolver:
+    global _endpoint_resolver
+    settings = (
+        (config['DISCOVERY_FINDER_URL'] or '').rstrip('/'), config['DISCOVERY_SERVICE_DOMAIN'],
+        config['DISCOVERY_RESOLVE_PATH'], float(config['DISCOVERY_CACHE_TTL']), float(config['DISCOVERY_NEGATIVE_TTL']),
+        float(config['DISCOVERY_TIMEOUT']), int(config['DISCOVERY_WORKERS']))
+    r = _endpoint_resolver
+    if r is None or (r.finder_url, r.service_domain, r.resolve_path, r.ttl, r.negative_ttl, r.timeout, r.max_workers) != settings:
+        _endpoint_resolver = EndpointResolver(*settings)
+    return _endpoint_resolver
+
+
+# クロール周期のプロファイリング(管理APIからの予約を保持する)
+cycle_profiler = CycleProfiler()
+# クロール周期毎のステージの処理時間
+stage_timings = StageTimings()
+
+
+# 設定ファイルの内容を反映したクロール周期のプロファイリングを取得する
+def get_cycle_profiler() -> CycleProfiler:
+    config = get_config()
+    cycle_profiler.configure(
+        output_dir=os.path.join(os.path.dirname(__file__), config['PROFILE_DIR']),
+        interval=float(config['PROFILE_SAMPLE_INTERVAL']),
+        frames=int(config['PROFILE_TRACEMALLOC_FRAMES']),
+        top=int(config['PROFILE_TOP']))
+    return cycle_profiler
+
+
+# 設定ファイルの内容を反映したステージの処理時間を取得する
+def get_stage_timings() -> StageTimings:
+    stage_timings.configure(int(get_config()['STAGE_TIMINGS_HISTORY']))
+    return stage_timings
+
+
+# 航路運営者エンドポイントへのHTTPクライアント(ホスト毎のレート制限・サーキットブレーカーを保持する)
+operator_client = OperatorClient()
+
+
+# 設定ファイルの内容を反映した航路運営者エンドポイントへのHTTPクライアントを取得する
+def get_operator_client() -> OperatorClient:
+    config = get_config()
+    operator_client.configure(
+        rate=float(config['RATE_LIMIT_PER_SEC']),
+        burst=float(config['RATE_LIMIT_BURST']),
+        connect_timeout=float(config['HTTP_CONNECT_TIMEOUT']),
+        read_timeout=float(config['HTTP_READ_TIMEOUT']),
+        failure_threshold=int(config['CIRCUIT_FAILURE_THRESHOLD']),
+        reset_timeout=float(config['CIRCUIT_RESET_TIMEOUT']))
+    return operator_client
+
+
+# 変更履歴とドメイン毎の集計(設定が変わるまで使い回す)
+_change_log = None
+_summary_index = None
+
+
+# 設定ファイルの内容を反映したドメイン毎の集計を取得する
+def get_summary_index(config: dict) -> SummaryIndex:
+    global _summary_index
+    path = os.path.join(os.path.dirname(__file__), config['SUMMARY_PATH'])
+    latest_size = int(config['SUMMARY_LATEST_SIZE'])
+    if _summary_index is None or (_summary_index.path, _summary_index.latest_size) != (path, latest_size):
+        _summary_index = SummaryIndex(path, latest_size)
+    return _summary_index
+
+
+# 設定ファイルの内容を反映した変更履歴を取得する(差分はドメイン毎の集計にも反映する)
+def get_change_log(config: dict) -> ChangeLog:
+    global _change_log
+    dirname = os.path.dirname(__file__)
+    path = os.path.join(dirname, config['CHANGELOG_PATH'])
+    snapshot_dir = os.path.join(dirname, config['CHANGELOG_SNAPSHOT_DIR'])
+    record_size = int(config['CHANGELOG_RECORD_SIZE'])
+    if _change_log is None or (_change_log.path, _change_log.snapshot_dir, _change_log.record_size) != (path, snapshot_dir, record_size):
+        _change_log = ChangeLog(path, snapshot_dir, record_size)
+    _change_log.listeners = [get_summary_index(config).apply]
+    return _change_log
+
+
+# グラフDBのバルクローダー(ドメイン毎のロード結果を保持するため使い回す)
+_bulk_loader = None
+
+
+# 設定ファイルの内容を反映したバルクローダーを取得する(BULKLOAD_LOADER_URL が未設定の場合は None)
+def get_bulk_loader(config: dict) -> Optional[BulkLoader]:
+    global _bulk_loader
+    if not config['BULKLOAD_LOADER_URL']:
+        return None
+    dirname = os.path.dirname(__file__)
+    settings = (
+        config['BULKLOAD_LOADER_URL'].rstrip('/'), os.path.join(dirname, config['BULKLOAD_STAGING_DIR']),
+        config['BULKLOAD_SOURCE_PREFIX'], config['BULKLOAD_FORMAT'], config['BULKLOAD_IAM_ROLE_ARN'],
+        config['BULKLOAD_REGION'], float(config['BULKLOAD_POLL_INTERVAL']), float(config['BULKLOAD_TIMEOUT']))
+    loader = _bulk_loader
+    if loader is None or (
+            loader.loader_url, loader.staging_dir, loader.source_prefix, loader.format, loader.iam_role_arn,
+            loader.region, loader.poll_interval, loader.timeout) != settings:
+        loader = BulkLoader(*settings)
+        # 設定が変わってもドメイン毎のロード結果は引き継ぐ
+        if _bulk_loader is not None:
+            loader.results = _bulk_loader.get_results()
+        _bulk_loader = loader
+    return loader
+
+
 # グラフDBに同じトリプルが存在しないか確認
 def check_triple_exist(graphdb_url: str, triple: dict) -> bool:
     # グラフDBへの接続
@@ -164,34 +385,161 @@ def check_triple_exist(graphdb_url: str, triple: dict) -> bool:
         return False
 
 
-# グラフDBにデータを登録
-def create_triple_data(endpoint: str, triple: dict, graph_url: str) -> str:
-    subject = triple['s']["value"]
-    predicate = triple['p']["value"]
-    obj = triple['o']["value"]
-    # domain = get_domain_name(endpoint)
-    obj = obj.replace("'", "\\'").replace('\\xFF', '\\\\xFF')
+# グラフDBのバックエンドを取得する
+# GRAPHDB_REPLICA_URL が設定されている場合は、ローカルのレプリカにも登録する
+def get_graph_store(config: dict) -> GraphStore:
+    store = open_store(config['GRAPHDB_INSERT_URL'], config['GRAPHDB_READ_URL'])
+    if config['GRAPHDB_REPLICA_URL']:
+        store = ReplicatedStore(store, open_store(config['GRAPHDB_REPLICA_URL']))
+    return store
 
-    # TODO: objがリテラルの場合の処理を追加
-    if triple['o']['type'] == 'uri':
-        obj = f"<{obj}>"
-    elif triple['o']['type'] == 'literal':
-        obj = f"'{obj}'"
-    
-    # INSERT DATA {{ <http://10.0.11.264:8084:~~~> <> <>}
-    query = f"INSERT DATA {{ <{subject}> <{predicate}> {obj} }}"
 
-    # query = f"INSERT DATA {{ GRAPH <{graph_url}> {{ <{subject}> <{predicate}> '{obj}' }} }}"
-    headers = {
-        'Content-Type': 'application/sparql-update'
-    }
+# クロールしたトリプルの登録先
+# パイプラインの登録ステージから、INSERT_BATCH_SIZE 毎にまとめたトリプルを受け取る
+class TripleSink:
+    def __init__(
+            self,
+            domain: str,
+            endpoint: str,
+            store: GraphStore,
+            batch_size: int,
+            bulk_loader: Optional[BulkLoader] = None,
+            bulk_threshold: int = 0,
+            checkpoint: Optional[CrawlCheckpoint] = None,
+            last_modified: Optional[str] = None,
+            offset: int = 0,
+            changeset: Optional[DomainChangeset] = None):
+        self.domain = domain
+        self.endpoint = endpoint
+        self.store = store
+        self.batch_size = batch_size
+        self.bulk_loader = bulk_loader
+        self.bulk_threshold = bulk_threshold
+        self.checkpoint = checkpoint
+        self.last_modified = last_modified
+        # 前回中断時に登録済みのトリプル数
+        self.offset = offset
+        # 受け取ったトリプル数
+        self.count = 0
+        # 登録済みのトリプル数(受け取った順に登録するため、再開時はこの数だけ読み飛ばす)
+        self.inserted = offset
+        # バルクロードを行うか判断するため、閾値に達するまで保留するトリプル
+        self.pending = []
+        self.staging = None
+        self.staged = 0
+        # 前回のクロールとの差分
+        self.changeset = changeset
+        # 登録に失敗したトリプルがある
+        self.failed = False
+
+    def __call__(self, batch: List[dict]):
+        if self.changeset is not None:
+            self.changeset.add(batch)
+        start = self.count
+        self.count += len(batch)
+        # 前回中断時に登録済みのトリプルは読み飛ばす
+        if self.count <= self.offset:
+            return
+        if start < self.offset:
+            batch = batch[self.offset - start:]
+
+        if self.bulk_loader is None:
+            self.insert(batch)
+            return
+
+        # トリプル数が閾値以上の場合は、ステージングファイルへ書き出してバルクローダーで一括登録する
+        if self.staging is None:
+            self.pending.extend(batch)
+            if len(self.pending) < self.bulk_threshold:
+                return
+            self.staging = self.bulk_loader.open_staging_file(self.domain)
+            batch, self.pending = self.pending, []
+        self.bulk_loader.write_staging(self.staging[1], batch)
+        self.staged += len(batch)
+
+    def insert(self, batch: List[dict]):
+        try:
+            self.store.insert_batch(batch)
+            logger.info(f"INSERT {self.domain=} {len(batch)=}")
+        except Exception as e:
+            logger.error(f"トリプルの登録に失敗しました: {self.endpoint=}, {str(e)}")
+            # 登録に失敗したトリプルを再開時に読み飛ばさないよう、以降は登録済みトリプル数を記録しない
+            self.failed = True
+        if not self.failed:
+            self.inserted += len(batch)
+            self.record_offset()
+
+    def record_offset(self):
+        if self.checkpoint is not None and not self.failed:
+            self.checkpoint.record_offset(self.domain, self.last_modified, self.inserted)
+            self.checkpoint.maybe_save()
+
+    def close(self):
+        """保留中のトリプルを登録し、バルクロードを行う(失敗した場合はSPARQLで登録する)"""
+        if self.staging is not None:
+            filename, f = self.staging
+            f.close()
+            result = self.bulk_loader.load_staged(self.domain, filename, self.staged)
+            if result['status'] == LOAD_COMPLETED:
+                self.inserted += self.staged
+                self.record_offset()
+            else:
+                # ステージングファイルを一行ずつ読み込み、まとめて登録する
+                batch = []
+                for triple in iter_staging_bindings(self.bulk_loader.staging_path(filename)):
+                    batch.append(triple)
+                    if len(batch) >= self.batch_size:
+                        self.insert(batch)
+                        batch = []
+                self.pending = batch + self.pending
+            self.bulk_loader.remove_staging(filename)
+            self.staging = None
+        for i in range(0, len(self.pending), self.batch_size):
+            self.insert(self.pending[i:i + self.batch_size])
+        self.pending = []
+        if self.changeset is not None:
+            self.commit_changeset()
+
+    def commit_changeset(self):
+        """前回のクロールとの差分を変更履歴へ記録し、航路運営者から削除されたトリプルをグラフDBから削除する"""
+        _, removed = self.changeset.commit()
+        # 同じトリプルを他の航路運営者も公開している場合は、グラフDBから削除しない
+        shared = self.changeset.changelog.published_elsewhere(self.domain, removed)
+        removed = [line for line in removed if line not in shared]
+        if not removed:
+            return
+        triples = []
+        skipped = 0
+        for triple in iter_ntriples_bindings([("\n".join(removed) + "\n").encode('utf-8')]):
+            # 空白ノードは DELETE DATA に指定できず、登録時にグラフDBが別のノードを割り当てるため特定できない
+            if any(triple[k]['type'] == 'bnode' for k in ('s', 'p', 'o')):
+                skipped += 1
+                continue
+            triples.append(triple)
+        if skipped:
+            logger.warning(f"空白ノードを含むトリプルはグラフDBから削除しません: {self.domain=} {skipped=}")
+        deleted = 0
+        for i in range(0, len(triples), self.batch_size):
+            batch = triples[i:i + self.batch_size]
+            # 一部のバッチが失敗しても、残りのバッチは削除する
+            try:
+                self.store.delete(batch)
+                deleted += len(batch)
+            except Exception as e:
+                logger.error(f"トリプルの削除に失敗しました: {self.endpoint=}, {str(e)}")
+        logger.info(f"DELETE {self.domain=} {deleted=}")
+
+    def abort(self):
+        """クロールが中断された場合は差分を記録しない"""
+        if self.staging is not None:
+            filename, f = self.staging
+            f.close()
+            # 再開時はチェックポイントの登録済みトリプル数から取得し直すため、ステージングファイルは使わない
+            self.bulk_loader.remove_staging(filename)
+            self.staging = None
+        if self.changeset is not None:
+            self.changeset.abort()
 
-    response = requests.post(endpoint, data=query, headers=headers)
-    if response.status_code == 200:
-        logger.info(f"INSERT {endpoint=} {query=}")
-        return response.text
-    else:
-        return f"Failed to insert data. Status code: {response.status_code}\n{response.text}"
 
 # 該当トリプルを削除
 # TODO: 今期は実装しない
@@ -226,47 +574,48 @@ def create_triple_data(endpoint: str, triple: dict, graph_url: str) -> str:
 #         return False
     
 
-# 再起処理にて、必要なエンドポイントに対してクローリングを行う
-def recursive_crawling(
+# 1ドメイン分のクローリングを行う
+# 戻り値は、取得したトリプルから発見したクローリング対象(ホワイトリスト記載)の別ドメインのエンドポイント一覧
+# チェックポイントが指定された場合は、前回中断時に登録済みのトリプルを読み飛ばし、登録済みトリプル数を記録する
+def crawl_domain(
         endpoint: str,
         last_updated: datetime,
         graphdb_read_url: str,
         graphdb_insert_url: str,
-        crawled_domain_list: List[str],
-        whitelist_path: str = "./whitelist") -> None:
-    logger.info(f"recursive_crawling()")
+        checkpoint: Optional[CrawlCheckpoint] = None) -> List[str]:
+    logger.info(f"crawl_domain()")
 
     domain = get_domain_name(endpoint)
-
-    # すでにクロール済みなら終了
-    if domain in crawled_domain_list:
-        return
-
-    # 1. クローリング済みエンドポイントリストに追加
-    crawled_domain_list.append(domain)
-    logger.info(f"{crawled_domain_list=}")
+    client = get_operator_client()
+    config = get_config()
+    # ディスカバリーファインダーからエンドポイントを取得する(登録がなければドメイン名から推測する)
+    resolved = get_endpoint_resolver(config).resolve(domain)
 
     if DEBUG:
-        logger.debug(f"recursive crawling: {endpoint=}, {last_updated=}, {graphdb_read_url=}, {graphdb_insert_url=}, {crawled_domain_list=}")
+        logger.debug(f"crawl domain: {endpoint=}, {last_updated=}, {graphdb_read_url=}, {graphdb_insert_url=}")
     
     logger.info(f"2. check endpoint update")
     # 2. エンドポイントにデータの更新日時を取得するAPIへリクエストを発行し、更新日時が前回の更新日時より前の場合は、再帰処理を返却する
     response = None
-    last_updated_url = get_last_updated_url(endpoint)
+    last_modified = None
+    last_updated_url = resolved.last_modified_url
     try:
-        response = requests.get(last_updated_url)
+        response = client.get(last_updated_url, domain)
+    except CircuitOpenError as e:
+        logger.warning(f"エンドポイント {endpoint} は失敗が続いているためスキップします: {str(e)}")
+        return []
     except requests.exceptions.RequestException as e:
         # 到達できないなどのエラーが発生した場合は、エラーメッセージを出力し、処理を終了する
         logger.error(f"エンドポイント {endpoint} には更新日時を取得するAPI {last_updated_url} へ到達できませんでした: {str(e)}")
-        return
+        return []
     
     if response is not None:
         if response.status_code == 404:
             logger.warn(f"エンドポイント {endpoint} には更新日時を取得するAPI {last_updated_url} が存在しません")
-            return 
-        if response.status_code == 500:
+            return []
+        if response.status_code >= 500:
             logger.error(f"エンドポイント {endpoint} はエラーが発生しています")
-            return
+            return []
 
         # 更新日時が取得できた
         if DEBUG:
@@ -285,104 +634,270 @@ def recursive_crawling(
     logger.info(f"3. check last modify")
     # 3. 更新日時が前回の更新日時以後の場合はすべてのデータを取得するSPARQLクエリを発行する
     
-    # .whitelist からクローリング対象のドメイン名一覧を取得し、リストオブジェクトにする
-    whitelist = get_namespace_list()
+    # .whitelist からクローリング対象のドメイン名一覧を取得し、集合オブジェクトにする
+    whitelist = set(get_namespace_list())
+
+    offset = 0
+    if checkpoint is not None:
+        offset = checkpoint.get_offset(domain, last_modified)
+        if offset > 0:
+            logger.info(f"resume {domain=} from {offset=}")
+    sink = TripleSink(
+        domain, endpoint, get_graph_store(config), int(config['INSERT_BATCH_SIZE']),
+        get_bulk_loader(config), int(config['BULKLOAD_THRESHOLD']),
+        checkpoint, last_modified, offset,
+        get_change_log(config).open_changeset(domain, endpoint))
+
+    discovered = []
+    discovered_domains = set()
+
+    # 再帰処理の対象となるかジャッジする(パイプラインの解析ステージで呼び出す)
+    def on_triple(triple: dict):
+        # TODO: Neptuneに登録する際には、既存のデータがあっても問題なく処理が実行される
+        # TODO: 削除処理
+
+        # 5. 取得したトリプルの目的語 (?o) のuri部分から名前空間(DNS Domain名 + マシン名）を取得する
+        if triple['o']['type'] != 'uri':  # uriでない場合はスキップ
+            return
+
+        o_namespace = get_domain_name(triple['o']['value'])
         
-    results = {}
+        # 今回はクローリング対象か確認するホワイトリストに、クローリング対象の名前空間が含まれているか確認する
+        if o_namespace in whitelist and o_namespace != domain and o_namespace not in discovered_domains:
+            logger.info(f"In whitelist {o_namespace=}")
+            discovered_domains.add(o_namespace)
+            discovered.append(get_endpoint(o_namespace))
+
     query = "SELECT ?s ?p ?o WHERE { ?s ?p ?o . }"
+    url = resolved.sparql_url
+    if DEBUG:
+        logger.debug(f"Get RDF data from {url} ({resolved.source})\n{query=}")
+    # 応答ヘッダーを受信した後の失敗(本文の受信中の失敗)は、サーキットブレーカーへ別途記録する
+    receiving = False
     try:
-        url = f"{get_endpoint(domain)}"  # TODO: パス部分は固定
-        if not endpoint.startswith('http'):
-            url = "http://" + url
-            if DEBUG:
-                logger.debug(f"Get RDF data from {url}\n{query=}")
-        response = requests.post(url, data=query)
-        logger.info(f"requests URL {url=} {query=}")
-        try:
-            results = response.json()
-        except:
-            logger.error(f"{url=}\n{query=}\n{response.text}")
-            return  # json ではない / ここにデータはなし
+        decoder = get_decoder(config['SPARQL_DECODER'], int(config['SPARQL_DECODER_BUFFER']))
+        with client.post(url, domain, data=query, headers={'Accept': ACCEPT}, stream=True) as response:
+            receiving = response.status_code < 500
+            logger.info(f"requests URL {url=} {query=}")
+            content_type = response.headers.get('Content-Type')
+            # 取得 → 解析 → 登録 をパイプラインで並行に実行する
+            pipeline = DomainPipeline(
+                response.iter_content(chunk_size=int(config['PIPELINE_CHUNK_SIZE'])),
+                lambda chunks: decoder.iter_bindings(chunks, content_type), on_triple, sink,
+                batch_size=int(config['INSERT_BATCH_SIZE']),
+                queue_size=int(config['PIPELINE_QUEUE_SIZE']),
+                deadline=float(config['CRAWL_DOMAIN_TIMEOUT']) or None)
+            stats = pipeline.run()
+        client.report_success(domain)
+        sink.close()
     except requests.exceptions.RequestException as e:
+        # 他のエンドポイントのクローリングを継続するため、例外は送出しない
+        if receiving:
+            client.report_failure(domain)
         logger.error(f"エンドポイント {endpoint} からデータを取得できませんでした: {str(e)}")
-        logger.error(f"{url=}\n{query=}\n{results=}")
-        raise e
-    bindings = results['results']['bindings']
-    if len(bindings) == 0:  # データなし
+        logger.error(f"{url=}\n{query=}")
+        sink.abort()
+        return []
+    except ValueError as e:
+        # 応答は受信できたため、航路運営者の失敗としては記録しない
+        if receiving:
+            client.report_success(domain)
+        logger.error(f"{url=}\n{query=}\n{str(e)}")
+        sink.abort()
+        return []  # SPARQLの検索結果ではない / ここにデータはなし
+    except DeadlineExceeded as e:
+        # 少しずつ送り続ける航路運営者で他のドメインのクローリングが止まらないよう、打ち切って失敗として記録する
+        client.report_failure(domain)
+        logger.error(f"エンドポイント {endpoint} からのデータの取得を打ち切りました: {str(e)}")
+        sink.abort()
+        return []
+    except Exception:
+        # 登録など航路運営者以外の失敗(サーキットブレーカーの試行中の状態は解除する)
+        if receiving:
+            client.report_success(domain)
+        sink.abort()
+        raise
+    logger.info(f"pipeline {domain=} {stats=}")
+    stage_timings.add_pipeline(stats)
+    if sink.count == 0:  # データなし
         logger.info(f"** No data **")
-        return 
-            
-    # 取得したトリプルを一つずつグラフDBに存在しないか確認し、存在する場合は削除する
-    for triple in bindings:
-        # TODO: Neptuneに登録する際には、既存のデータがあっても問題なく処理が実行される
-        # if check_triple_exist(graphdb_read_url, triple):
-        #     # if DEBUG:
-        #         # print(f"triple exist.\n{triple=}")
-        #     pass
+    # 発見したドメインのエンドポイントを並行して解決し、キャッシュしておく
+    get_endpoint_resolver(config).resolve_many(discovered_domains)
+    return discovered
 
-        # TODO: 削除処理
 
-        # 一つのトリプル毎にINSERT処理を行う
-        if not create_triple_data(graphdb_insert_url, triple, endpoint):
-            logger.error(f"トリプルの登録に失敗しました: {endpoint=}, {triple=}")
+# フロンティア(これからクロールするエンドポイント)が空になるまで、必要なエンドポイントに対してクローリングを行う
+# 再帰処理と同じ順序でクロールするため、フロンティアはスタックとして扱う
+# crawl_queue が指定された場合は、キューが空になるまでキューのエンドポイントもクロールし、
+# キューから取り出したエンドポイントを返却する
+def crawl_frontier(
+        frontier: List[str],
+        last_updated: datetime,
+        graphdb_read_url: str,
+        graphdb_insert_url: str,
+        crawled_domain_list: List[str],
+        checkpoint: Optional[CrawlCheckpoint] = None,
+        crawl_queue: Optional[EndPointListClass] = None) -> List[str]:
+    logger.info(f"crawl_frontier()")
 
-        # 再帰処理をするかジャッジする
-        # 5. 取得したトリプルの目的語 (?o) のuri部分から名前空間(DNS Domain名 + マシン名）を取得する
-        if triple['o']['type'] != 'uri':  # uriでない場合はスキップ
+    submitted = []
+    frontier = list(reversed(frontier))
+    profiler = get_cycle_profiler()
+    cycle_id = checkpoint.cycle_id if checkpoint is not None else 'adhoc'
+    while True:
+        # interactive のエンドポイント(と長く待った background のエンドポイント)は、ドメインの区切りで割り込む
+        # それ以外のキューのエンドポイントは、発見したリンクをクロールし終えてから取り出す
+        item = crawl_queue.pop(urgent_only=bool(frontier)) if crawl_queue is not None else None
+        if item is not None:
+            endpoint, lane = item
+            submitted.append(endpoint)
+            if checkpoint is not None:
+                checkpoint.add_endpoint(endpoint)
+        elif frontier:
+            endpoint, lane = frontier.pop(), BACKGROUND
+        else:
+            break
+        if checkpoint is not None:
+            # クロール中のエンドポイントは、完了するまでフロンティアに残す(中断した場合は登録済みトリプル数から再開する)
+            pending = crawl_queue.get() if crawl_queue is not None else []
+            checkpoint.set_frontier([endpoint] + list(reversed(frontier)) + pending)
+            checkpoint.maybe_save()
+        domain = get_domain_name(endpoint)
+
+        # すでにクロール済みならスキップ(利用者が登録したエンドポイントは、同じ周期でも再度クロールする)
+        if domain in crawled_domain_list and lane != INTERACTIVE:
             continue
+        if domain in crawled_domain_list:
+            crawled_domain_list.remove(domain)
 
-        o_namespace = get_domain_name(triple['o']['value'])
-        namespace_url = get_endpoint(o_namespace)
-        logger.info(f"{o_namespace=} {whitelist=}")
-        
-        # 今回はクローリング対象か確認するホワイトリストに、クローリング対象の名前空間が含まれているか確認する
-        if o_namespace in whitelist:
-            logger.info(f"In whitelist")
+        # 1. クローリング済みエンドポイントリストに追加
+        crawled_domain_list.append(domain)
+        logger.info(f"{crawled_domain_list=}")
+
+        if crawl_queue is not None:
+            crawl_queue.start(endpoint)
+        try:
+            # 管理APIからこのドメインのプロファイリングが予約されていれば、クロールの間だけプロファイリングする
+            with profiler.domain(cycle_id, domain):
+                discovered = crawl_domain(endpoint, last_updated, graphdb_read_url, graphdb_insert_url, checkpoint)
+        except Exception as e:
+            # 一つの航路運営者の異常で、他の航路運営者のクローリングを中断しない
+            logger.error(f"エンドポイント {endpoint} のクローリング中にエラーが発生しました: {str(e)}")
+            discovered = []
+        finally:
+            if crawl_queue is not None:
+                crawl_queue.finish(endpoint)
+
+        if checkpoint is not None:
+            checkpoint.complete(domain)
+
+        # 6. クローリング対象の名前空間の場合は、フロンティアに追加する
+        for namespace_url in reversed(discovered):
             # Nmaespaceがクローリング済みエンドポイントリストに含まれていないか確認する
-            if o_namespace not in crawled_domain_list:
-                logger.info(f"In {crawled_domain_list=}")
-                # 6. クローリング対象の名前空間の場合は、再帰処理を行う
-                # testだけホワイトリストものだけトリプルを追加
-                # create_triple_data(graphdb_insert_url, triple, endpoint)
-                recursive_crawling(
-                    namespace_url, last_updated,
-                    graphdb_read_url, graphdb_insert_url, crawled_domain_list)
+            if get_domain_name(namespace_url) not in crawled_domain_list:
+                frontier.append(namespace_url)
             else:
                 if DEBUG:
-                    logger.debug(f"クローリング済みの名前空間: {o_namespace}, {crawled_domain_list=}")
+                    logger.debug(f"クローリング済みの名前空間: {namespace_url}, {crawled_domain_list=}")
+
+    return submitted
+
+
+# シャーディングによるクローリングのコーディネーター(設定が変わるまで使い回す)
+_sharded_crawler = None
+
+
+def get_sharded_crawler(config: dict) -> ShardedCrawler:
+    global _sharded_crawler
+    shard_count = int(config['CRAWL_SHARDS'] or 1)
+    nodes = [n.strip() for n in config['CRAWL_NODES'].split(',') if n.strip()]
+    self_node = config['CRAWL_NODE_SELF'] or None
+    crawler = _sharded_crawler
+    if crawler is None or (crawler.shard_count, crawler.nodes, crawler.self_node) != (shard_count, nodes, self_node):
+        if crawler is not None:
+            crawler.shutdown()
+        crawler = ShardedCrawler(
+            crawl_domain, get_domain_name, shard_count, nodes, self_node,
+            forward_interval=int(config['CRAWLING_INTERVAL']))
+        _sharded_crawler = crawler
+    return crawler
 
 
 # クローリング処理
-def crawling_data(endpoint_list: List, last_updated: datetime) -> None:
+# checkpoint が指定された場合は、中断されたクロール周期をチェックポイントから再開する
+# crawl_queue が指定された場合は、キューが空になるまでキューのエンドポイントもクロールする
+# クロールした endpoint_list とキューのエンドポイントを返却する
+def crawling_data(
+        endpoint_list: List,
+        last_updated: datetime,
+        checkpoint: Optional[CrawlCheckpoint] = None,
+        crawl_queue: Optional[EndPointListClass] = None) -> List[str]:
     logger.info(f"crawling_data()")
     
-    # endpoint_listの被りがないようにする
-    endpoint_list = list(set(endpoint_list))
-    
     # 設定ファイルの読み込み
     config = get_config()
+    sharded = int(config['CRAWL_SHARDS'] or 1) > 1 or config['CRAWL_NODES']
+
+    # 分散クローリングでは、キューのエンドポイントを優先度順にまとめて取り出す
+    if sharded and crawl_queue is not None:
+        endpoint_list = list(endpoint_list) + crawl_queue.pop_all()
+
+    # endpoint_listの被りがないようにする(順序は維持する)
+    endpoint_list = list(dict.fromkeys(endpoint_list))
     
     # Neptune接続設定
     graphdb_read_url = config['GRAPHDB_READ_URL']
     graphdb_insert_url = config['GRAPHDB_INSERT_URL']
+
+    # チェックポイントの作成
+    if checkpoint is None:
+        checkpoint = CrawlCheckpoint(
+            get_checkpoint_path(config), endpoint_list, last_updated,
+            interval=float(config['CHECKPOINT_INTERVAL']))
+        frontier = endpoint_list
+    else:
+        logger.info(f"resume crawling {checkpoint.cycle_id=} {checkpoint.frontier=}")
+        frontier = checkpoint.frontier + [e for e in endpoint_list if e not in checkpoint.frontier]
+        for endpoint in endpoint_list:
+            checkpoint.add_endpoint(endpoint)
+    checkpoint.save()
+    stage_timings.set_cycle_id(checkpoint.cycle_id)
+    # 管理APIからクロール周期のプロファイリングが予約されていれば、この周期の間だけプロファイリングする
+    profiling = get_cycle_profiler().cycle(checkpoint.cycle_id)
+
+    # 複数プロセス・複数ノードで分散してクローリングする
+    if sharded:
+        sharded_crawler = get_sharded_crawler(config)
+        with profiling:
+            crawled_domain_list = sharded_crawler.run(
+                frontier, last_updated, graphdb_read_url, graphdb_insert_url, checkpoint=checkpoint)
+        logger.info(f"{crawled_domain_list=}")
+        get_change_log(config).complete_cycle(checkpoint.cycle_id)
+        checkpoint.clear()
+        return endpoint_list
     
-    crawled_domain_list = []
+    crawled_domain_list = list(checkpoint.completed)
     
-    # クローリング対象リストのエンドポイントが、クロール済みエンドポイントリストにないか確認し、ないものだけ追加する
-    for endpoint in endpoint_list:
-        # 3.の再帰処理を行う
-        recursive_crawling(
-            endpoint, last_updated, graphdb_read_url, graphdb_insert_url, crawled_domain_list)
-    return
+    # クローリング対象リストのエンドポイントが、クロール済みエンドポイントリストにないか確認し、ないものだけクロールする
+    with profiling:
+        submitted = crawl_frontier(
+            frontier, last_updated, graphdb_read_url, graphdb_insert_url, crawled_domain_list, checkpoint, crawl_queue)
+
+    # クロール周期が完了したため、変更履歴へ記録し、チェックポイントを削除する
+    get_change_log(config).complete_cycle(checkpoint.cycle_id)
+    checkpoint.clear()
+    return list(dict.fromkeys(endpoint_list + submitted))
 
 
 # エンドポイント監視クラス
 class EndPointMonitor(threading.Thread):
-    def __init__(self, endpoint_list_obj: EndPointListClass, planed_endpoint_list_obj: PlanedEndPointListClass, last_updated: datetime):
+    def __init__(self, endpoint_list_obj: EndPointListClass, planed_endpoint_list_obj: PlanedEndPointListClass, last_updated: datetime, checkpoint: Optional[CrawlCheckpoint] = None):
         super().__init__()
         self.endpoint_list_obj = endpoint_list_obj
         self.planed_endpoint_list_obj = planed_endpoint_list_obj
         self.last_updated = last_updated
+        # 中断されたクロール周期のチェックポイント(最初のクローリングで再開する)
+        self.checkpoint = checkpoint
         self._stop_event = threading.Event()
         
     def stop(self):
@@ -391,50 +906,61 @@ class EndPointMonitor(threading.Thread):
         
     def run(self):
         """エンドポイントリストを監視し続け、要素が追加されればその要素を元に処理を開始する"""
+        # 前回のクロール周期の終了からエンドポイントが追加されるまで待機した時間
+        scheduler_wait = 0.0
         while not self._stop_event.is_set():
             try:
-                # エンドポイントリストの取得
-                endpoint_list = self.endpoint_list_obj.get()
-                logger.info(f"{endpoint_list=}")
-                
-                if len(endpoint_list) > 0:
-                    # クローリング処理
-                    crawling_data(endpoint_list, self.last_updated)
-                                        
-                    # 設定日時を更新
-                    self.last_updated = datetime.now()
-                    logger.info(f"{self.last_updated=}")
-
-                    # 各ドメインごとにデータをパブリッシュ
-                    for endpoint in endpoint_list:
-                        domain = get_domain_name(endpoint)
-                        topic = domain
-                        msg = "updated"
-                        # データをパブリッシュ
-                        pubobj = PublishUtil( "localhost", 1883)
-                        pubobj.connect()
-                        status = pubobj.publish(topic, msg)
-                        if DEBUG:
-                            if status == 0:
-                                logger.info(f"publish success: {topic} {msg}")
-                            else:
-                                logger.warn(f"publish failed: {topic} {msg}")
-                        pubobj.disconnect()
-                    
-                    logger.info(f"{self.endpoint_list_obj.get()=}")
-                    for eobj in self.endpoint_list_obj.get():
-                        logger.info(f"append{eobj=}")
-                        if eobj not in self.planed_endpoint_list_obj.get():
-                            self.planed_endpoint_list_obj.append(eobj)
-                    logger.info(f"{self.planed_endpoint_list_obj.get()=}")
-
-                    # 処理を終えたエンドポイントをクリア
-                    self.endpoint_list_obj.clear()
-
-                # 設定ファイルから、定期更新の間隔を取得し、待機する
+                # 設定ファイルから、監視の間隔を取得する
                 config = get_config()
                 monitor_interval = int(config['MONITOR_INTERVAL'])
-                time.sleep(monitor_interval)
+                self.endpoint_list_obj.configure(
+                    float(config['QUEUE_AGING']), float(config['QUEUE_DEFAULT_DURATION']),
+                    float(config['QUEUE_EWMA_ALPHA']))
+                timings = get_stage_timings()
+
+                # エンドポイントが追加されるまで待機する(追加されればすぐにクローリングを開始する)
+                started = time.monotonic()
+                added = self.checkpoint is not None or self.endpoint_list_obj.wait(monitor_interval)
+                scheduler_wait += time.monotonic() - started
+                if not added:
+                    continue
+                logger.info(f"{self.endpoint_list_obj.get()=}")
+
+                # クローリング処理(キューが空になるまで、優先度順にクロールする)
+                timings.begin(scheduler_wait)
+                scheduler_wait = 0.0
+                checkpoint, self.checkpoint = self.checkpoint, None
+                endpoint_list = crawling_data([], self.last_updated, checkpoint, self.endpoint_list_obj)
+                logger.info(f"{endpoint_list=}")
+                                    
+                # 設定日時を更新
+                self.last_updated = datetime.now()
+                logger.info(f"{self.last_updated=}")
+
+                # 各ドメインごとにデータをパブリッシュ
+                started = time.monotonic()
+                for endpoint in endpoint_list:
+                    domain = get_domain_name(endpoint)
+                    topic = domain
+                    msg = "updated"
+                    # データをパブリッシュ
+                    pubobj = PublishUtil( "localhost", 1883)
+                    pubobj.connect()
+                    status = pubobj.publish(topic, msg)
+                    if DEBUG:
+                        if status == 0:
+                            logger.info(f"publish success: {topic} {msg}")
+                        else:
+                            logger.warn(f"publish failed: {topic} {msg}")
+                    pubobj.disconnect()
+                timings.add('publish', time.monotonic() - started)
+                timings.end()
+                
+                for eobj in endpoint_list:
+                    logger.info(f"append{eobj=}")
+                    if eobj not in self.planed_endpoint_list_obj.get():
+                        self.planed_endpoint_list_obj.append(eobj)
+                logger.info(f"{self.planed_endpoint_list_obj.get()=}")
                 
             except Exception as e:
                 logger.error(f"EndpointListMonitor error: {str(e)}")
@@ -479,7 +1005,7 @@ class CrawlingScheduler(threading.Thread):
                 # if last_updated_tmp == self.last_updated:
                 # クロール対象リストオブジェクトからエンドポイントリストへ格納する
                 logger.info(f"{self.planed_endpoint_list_obj.get()=}")
-                self.endpoint_list_obj.conbine(self.planed_endpoint_list_obj.get())
+                self.endpoint_list_obj.conbine(self.planed_endpoint_list_obj.get(), BACKGROUND)
                 # 待機時間をそのまま設定
                 remaining_time = int(crawling_interval_str)
                 # 更新日時を記憶
@@ -505,6 +1031,13 @@ class Crawling():
     def __init__(self, endpoint_list_obj: EndPointListClass, planed_endpoint_list: PlanedEndPointListClass):
         # 設定日時(UTC)で、初期値は1990-01-01T00:00:00Zとする
         last_updated = datetime.strptime('1990-01-01T00:00:00Z', '%Y-%m-%dT%H:%M:%SZ')
+
+        # 前回のクロール周期が中断されていれば、チェックポイントから再開する
+        checkpoint = CrawlCheckpoint.load(get_checkpoint_path(get_config()))
+        if checkpoint is not None:
+            logger.info(f"found checkpoint {checkpoint.cycle_id=}")
+            last_updated = checkpoint.last_updated
+            endpoint_list_obj.conbine(checkpoint.endpoint_list, BACKGROUND)
             
         # 「エンドポイントリストを監視し続け、要素が追加されればその要素を元に処理を開始する」処理と
         # 「クローリング間隔がすぎると、エンドポイントリストに、予約されいるエンドポイントを追加する」処理の
@@ -512,7 +1045,7 @@ class Crawling():
         # それぞれの処理は、無限ループする
         
         # エンドポイント監視スレッド
-        endpoint_monitor = EndPointMonitor(endpoint_list_obj, planed_endpoint_list, last_updated)
+        endpoint_monitor = EndPointMonitor(endpoint_list_obj, planed_endpoint_list, last_updated, checkpoint)
         # クローリング間隔処理スレッド
         crawling_scheduler = CrawlingScheduler(endpoint_list_obj, planed_endpoint_list, last_updated)
         
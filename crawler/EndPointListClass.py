@@ -1,28 +1,165 @@
-"""EndPointList の管理モジュール."""
+"""EndPointList の管理モジュール.
+
+クローリング対象のエンドポイントを、優先度付きのキューとして管理する。
+
+* interactive: 利用者が登録したエンドポイント(sendEndpointList)。クロール中でもドメインの区切りで割り込む
+* background : 定期的な再クロール(CrawlingScheduler)やノード間で転送されたエンドポイント
+
+interactive のエンドポイントは aging 秒前に登録されたものとして並べるため、
+aging 秒以上待った background のエンドポイントは、後から登録された interactive のエンドポイントより先にクロールされる。
+"""
 import logging
 import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
 
 logger = logging.getLogger(__name__)
 
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+
+class _Entry:
+    def __init__(self, endpoint: str, lane: str, enqueued_at: float):
+        self.endpoint = endpoint
+        self.lane = lane
+        self.enqueued_at = enqueued_at
+
+
 class EndPointListClass:
-    endpoint_list = []
 
-    def __init__(self):
-        self.lock = threading.Lock()
+    def __init__(self, aging: float = 600.0, default_duration: float = 30.0, alpha: float = 0.3):
+        self.lock = threading.Condition()
+        self.entries: List[_Entry] = []
+        self.aging = aging
+        self.default_duration = default_duration
+        self.alpha = alpha
+        # エンドポイント毎のクロール時間(秒)の指数移動平均
+        self.durations: Dict[str, float] = {}
+        # クロール中のエンドポイントと開始時刻
+        self.current: Optional[Tuple[str, float]] = None
 
-    def get(self):
-        logger.info(f"{self.endpoint_list=}")
-        return self.endpoint_list
+    def configure(self, aging: float, default_duration: float, alpha: float):
+        with self.lock:
+            self.aging = aging
+            self.default_duration = default_duration
+            self.alpha = alpha
+
+    def _key(self, entry: _Entry) -> float:
+        if entry.lane == INTERACTIVE:
+            return entry.enqueued_at - self.aging
+        return entry.enqueued_at
+
+    def _ordered(self) -> List[_Entry]:
+        return sorted(self.entries, key=self._key)
+
+    def _is_urgent(self, entry: _Entry, now: float) -> bool:
+        return entry.lane == INTERACTIVE or now - entry.enqueued_at >= self.aging
 
-    def append(self, endpoint: str):
+    def get(self):
+        """キューのエンドポイントをクロールする順に返却する"""
         with self.lock:
-            self.endpoint_list.append(endpoint)
+            endpoint_list = [entry.endpoint for entry in self._ordered()]
+        logger.info(f"{endpoint_list=}")
+        return endpoint_list
 
-    def conbine(self, endpoint_list: list):
+    def append(self, endpoint: str, lane: str = BACKGROUND):
+        """エンドポイントを追加する(キューにあるエンドポイントは、interactive で追加された場合のみ昇格する)"""
+        if lane not in LANES:
+            raise ValueError(f"優先度は {LANES} のいずれかを指定してください: {lane}")
         with self.lock:
-            self.endpoint_list.extend(endpoint_list)
+            for entry in self.entries:
+                if entry.endpoint == endpoint:
+                    if lane == INTERACTIVE:
+                        entry.lane = INTERACTIVE
+                    break
+            else:
+                self.entries.append(_Entry(endpoint, lane, time.time()))
+            self.lock.notify_all()
+
+    def conbine(self, endpoint_list: list, lane: str = BACKGROUND):
+        for endpoint in endpoint_list:
+            self.append(endpoint, lane)
 
     def clear(self):
         with self.lock:
-            self.endpoint_list = []
+            self.entries = []
+
+    def wait(self, timeout: float) -> bool:
+        """エンドポイントが追加されるまで最大 timeout 秒待機する(キューが空でなければ True)"""
+        with self.lock:
+            return self.lock.wait_for(lambda: len(self.entries) > 0, timeout=timeout)
+
+    def pop(self, urgent_only: bool = False) -> Optional[Tuple[str, str]]:
+        """次にクロールするエンドポイントと優先度を取り出す(キューが空の場合は None)
+
+        urgent_only の場合は、interactive または aging 秒以上待ったエンドポイントのみ取り出す。
+        """
+        with self.lock:
+            if not self.entries:
+                return None
+            entry = self._ordered()[0]
+            if urgent_only and not self._is_urgent(entry, time.time()):
+                return None
+            self.entries.remove(entry)
+            return entry.endpoint, entry.lane
+
+    def pop_all(self) -> List[str]:
+        """キューのエンドポイントをクロールする順にすべて取り出す"""
+        with self.lock:
+            endpoint_list = [entry.endpoint for entry in self._ordered()]
+            self.entries = []
+            return endpoint_list
+
+    def start(self, endpoint: str):
+        """エンドポイントのクロール開始を記録する"""
+        with self.lock:
+            self.current = (endpoint, time.time())
+
+    def finish(self, endpoint: str):
+        """エンドポイントのクロール終了を記録し、クロール時間の平均を更新する"""
+        with self.lock:
+            if self.current is None or self.current[0] != endpoint:
+                return
+            elapsed = time.time() - self.current[1]
+            self.current = None
+            average = self.durations.get(endpoint)
+            self.durations[endpoint] = elapsed if average is None else \
+                self.alpha * elapsed + (1 - self.alpha) * average
+
+    def _estimate(self, endpoint: str) -> float:
+        return self.durations.get(endpoint, self.default_duration)
+
+    def position(self, endpoint: str) -> Optional[Dict]:
+        """エンドポイントのキュー内の位置と開始予定時刻(UNIX時刻)を返却する(キューにない場合は None)
+
+        開始予定時刻は、クロール中のエンドポイントの残り時間と、前に並ぶエンドポイントの平均クロール時間から見積もる。
+        クロール中に発見したリンクのクロール時間は含まない。
+        """
+        with self.lock:
+            now = time.time()
+            if self.current is not None and self.current[0] == endpoint:
+                return {
+                    'endpoint': endpoint,
+                    'status': 'crawling',
+                    'position': 0,
+                    'started_at': self.current[1],
+                    'estimated_start': self.current[1],
+                }
+            eta = now
+            if self.current is not None:
+                eta += max(self._estimate(self.current[0]) - (now - self.current[1]), 0.0)
+            for position, entry in enumerate(self._ordered(), start=1):
+                if entry.endpoint == endpoint:
+                    return {
+                        'endpoint': endpoint,
+                        'status': 'queued',
+                        'lane': entry.lane,
+                        'position': position,
+                        'waited': round(now - entry.enqueued_at, 3),
+                        'estimated_start': eta,
+                    }
+                eta += self._estimate(entry.endpoint)
+            return None
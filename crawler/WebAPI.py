@@ -8,6 +8,8 @@ from pubsub import pub
 import uuid
 import logging
 
+from lib_singleflight import AsyncSingleFlight, normalize_query
+
 # ロギングの設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,6 +33,9 @@ class SubscriptionRequest(BaseModel):
 # インメモリストレージ（実際の実装では永続化が必要）
 subscriptions: Dict[str, Subscription] = {}
 
+# 同じクエリの同時実行をまとめる
+single_flight = AsyncSingleFlight()
+
 # トピックのバリデーション
 VALID_TOPICS = ["orders", "users", "products"]  # 例として
 
@@ -96,31 +101,36 @@ async def send_query(request: Request):
 
         # SPARQLエンドポイントへのリクエストを構築
         sparql_endpoint = "http://localhost:8890"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                sparql_endpoint,
-                data={"query": query},
-                headers={"Accept": accept_header}
-            )
 
-            # レスポンスのステータスコードとContent-Typeを保持
-            content_type = response.headers.get("Content-Type", "text/plain")
-            
-            # エラーハンドリング
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"SPARQL endpoint error: {response.text}"
+        async def forward_query():
+            async with httpx.AsyncClient() as client:
+                return await client.post(
+                    sparql_endpoint,
+                    data={"query": query},
+                    headers={"Accept": accept_header}
                 )
 
-            # レスポンスを返却（Content-Typeを維持）
-            return Response(
-                content=response.content,
-                media_type=content_type,
-                status_code=response.status_code
+        # 同じクエリ・Accept のリクエストが実行中であれば、SPARQLエンドポイントへは転送せずにその結果を共有する
+        response, shared = await single_flight.do((normalize_query(query), accept_header), forward_query)
+        logger.info(f"{shared=}")
+
+        # レスポンスのステータスコードとContent-Typeを保持
+        content_type = response.headers.get("Content-Type", "text/plain")
+        
+        # エラーハンドリング
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"SPARQL endpoint error: {response.text}"
             )
 
+        # レスポンスを返却（Content-Typeを維持）
+        return Response(
+            content=response.content,
+            media_type=content_type,
+            status_code=response.status_code
+        )
+
     except httpx.RequestError as e:
         logger.error(f"Error forwarding query: {str(e)}")
         raise HTTPException(
@@ -134,6 +144,11 @@ async def send_query(request: Request):
             detail=f"Internal server error: {str(e)}"
         )
 
+@app.get("/v1/api/queryStats")
+async def query_stats():
+    """SPARQLエンドポイントへ転送したクエリ数と、実行中のクエリの結果を共有したクエリ数を返却する"""
+    return single_flight.get_stats()
+
 @app.delete("/subscriptions/{subscription_id}")
 async def delete_subscription(subscription_id: str):
     if subscription_id not in subscriptions:
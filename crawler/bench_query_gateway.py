@@ -0,0 +1,371 @@
+"""検索API(/v1/api/sendQuery) の負荷試験.
+
+グラフDB(SPARQL エンドポイント) と設計支援システムのモックを起動し、クエリのコーパスを
+目標のリクエスト数/秒・同時接続数で送信して、スループットとレイテンシ(p50/p95/p99) を計測する。
+
+    # モックのみ起動する(WebAPI の SPARQL エンドポイントは http://localhost:8890 固定のため、同じポートで起動する)
+    $ python bench_query_gateway.py mock --latency 0.05 --rows 1000
+
+    # 起動済みの検索APIへ送信する(--target は複数指定でき、順に計測して並べて表示する)
+    $ python bench_query_gateway.py run --target app_link=http://localhost:8081 --rps 50 --concurrency 16
+
+    # モック、app_link(Flask)、WebAPI(FastAPI) を起動し、同じ条件で比較する
+    $ python bench_query_gateway.py compare --rps 50 --concurrency 16 --duration 30
+
+コーパスは1行1件の JSON Lines ({"query": "...", "accept": "..."}、accept は省略可) で指定する。
+省略した場合は航路データを検索する数件のクエリを使う。
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from bench_sparql_results import generate_bindings, to_json
+
+
+DEFAULT_CORPUS = [
+    {'query': "SELECT ?s ?p ?o WHERE { ?s ?p ?o . } LIMIT 100"},
+    {'query': "PREFIX ao: <http://airway.example.com/ontology#>\n"
+              "SELECT ?s WHERE { ?s a ao:Waypoint . } LIMIT 1000"},
+    {'query': "PREFIX ao: <http://airway.example.com/ontology#>\n"
+              "SELECT ?s ?lat ?lon WHERE { ?s ao:latitude ?lat ; ao:longitude ?lon . } LIMIT 500"},
+    {'query': "PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>\n"
+              "SELECT ?s ?label WHERE { ?s rdfs:label ?label . FILTER(lang(?label) = \"ja\") } LIMIT 200"},
+]
+
+
+def load_corpus(path: Optional[str]) -> List[dict]:
+    if not path:
+        return DEFAULT_CORPUS
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class MockServer:
+    """グラフDB と設計支援システムのモック
+
+    グラフDB は GET/POST のどちらでも、latency 秒(±jitter) 待ってから rows 件の検索結果を返却する。
+    設計支援システムは sink_latency 秒待ってから、sink_error_rate の割合で 500 を、それ以外は 200 を返却する。
+    """
+
+    def __init__(
+            self, sparql_port: int = 8890, sink_port: int = 5000, latency: float = 0.05, jitter: float = 0.0,
+            rows: int = 1000, sink_latency: float = 0.0, sink_error_rate: float = 0.0, host: str = 'localhost'):
+        self.latency = latency
+        self.jitter = jitter
+        self.sink_latency = sink_latency
+        self.sink_error_rate = sink_error_rate
+        self.body = to_json(generate_bindings(rows))
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.servers = [
+            ThreadingHTTPServer((host, sparql_port), self._handler(self._sparql)),
+            ThreadingHTTPServer((host, sink_port), self._handler(self._sink)),
+        ]
+        for server in self.servers:
+            server.daemon_threads = True
+
+    def _handler(self, respond):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                respond(self)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                respond(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _sparql(self, handler: BaseHTTPRequestHandler):
+        self._count('sparql')
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/sparql-results+json')
+        handler.send_header('Content-Length', str(len(self.body)))
+        handler.end_headers()
+        handler.wfile.write(self.body)
+
+    def _sink(self, handler: BaseHTTPRequestHandler):
+        time.sleep(self.sink_latency)
+        failed = random.random() < self.sink_error_rate
+        self._count('sink_error' if failed else 'sink')
+        body = b'{}'
+        handler.send_response(500 if failed else 200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近接順位法によるパーセンタイル(values は昇順)"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def run_load(
+        url: str, corpus: List[dict], rps: float, concurrency: int, duration: float, timeout: float) -> Dict:
+    """url へコーパスのクエリを順に送信し、結果を集計する
+
+    rps を指定した場合は 1/rps 秒毎に送信予定時刻を割り当て(オープンループ)、レイテンシは送信予定時刻から計測する。
+    同時接続数が足りず送信が遅れた分もレイテンシに含めるため、過負荷時に待たされた時間が隠れない。
+    rps が 0 の場合は concurrency 本のスレッドが応答を受け取り次第、次のリクエストを送信する(クローズドループ)。
+    """
+    endpoint = f"{url.rstrip('/')}/v1/api/sendQuery"
+    latencies: List[float] = []
+    statuses = Counter()
+    lock = threading.Lock()
+    sequence = iter(range(sys.maxsize))
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                i = next(sequence)
+            scheduled = started + i / rps if rps > 0 else time.perf_counter()
+            if scheduled >= deadline:
+                return
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            item = corpus[i % len(corpus)]
+            headers = {'Accept': item['accept']} if item.get('accept') else {}
+            try:
+                response = session.post(endpoint, data={'query': item['query']}, headers=headers, timeout=timeout)
+                status = str(response.status_code)
+            except requests.exceptions.Timeout:
+                status = 'timeout'
+            except requests.exceptions.RequestException:
+                status = 'error'
+            elapsed = time.perf_counter() - scheduled
+            with lock:
+                statuses[status] += 1
+                if status == '200':
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = sum(statuses.values())
+    return {
+        'requests': total,
+        'ok': statuses['200'],
+        'statuses': dict(statuses),
+        'elapsed': elapsed,
+        'throughput': statuses['200'] / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1] if latencies else 0.0,
+    }
+
+
+def get_query_stats(url: str) -> Optional[Dict]:
+    try:
+        response = requests.get(f"{url.rstrip('/')}/v1/api/queryStats", timeout=5)
+        if response.status_code == 200:
+            return response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return None
+
+
+def print_results(results: List[Tuple[str, Dict]]):
+    print(f"{'対象':<12}{'件数':>8}{'成功':>8}{'件/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}  ステータス")
+    for name, r in results:
+        print(f"{name:<12}{r['requests']:>8}{r['ok']:>8}{r['throughput']:>10.1f}"
+              f"{r['p50'] * 1000:>10.1f}{r['p95'] * 1000:>10.1f}{r['p99'] * 1000:>10.1f}{r['max'] * 1000:>10.1f}"
+              f"  {json.dumps(r['statuses'])}")
+    for name, r in results:
+        if r.get('mock') is not None:
+            print(f"{name} mock: {json.dumps(r['mock'])}")
+        if r.get('query_stats') is not None:
+            print(f"{name} queryStats: {json.dumps(r['query_stats'], ensure_ascii=False)}")
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    """検索APIが接続を受け付けるまで待つ"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} の起動に失敗しました (終了コード {process.returncode})")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} が {timeout} 秒以内に起動しませんでした")
+
+
+def serve_app_link(args):
+    """負荷試験用に app_link を起動する(クローラは起動せず、グラフDB と設計支援システムはモックを参照する)"""
+    app_link_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'app_link')
+    os.chdir(app_link_dir)
+    sys.path.insert(0, app_link_dir)
+    import app_link
+
+    # 流量制御などは config.ini の設定を使う
+    app_link.config.read(args.config)
+    app_link.config.read_dict({
+        'sparql': {'endpoint': args.sparql_url, 'replica': '', 'timeout': str(args.timeout)},
+        'design_support': {'url': args.sink_url},
+    })
+    app_link.admission.configure(app_link.config)
+    app_link.app.run(host='localhost', port=args.port, threaded=True)
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--sparql-port', type=int, default=8890)
+    parser.add_argument('--sink-port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.05, help="グラフDB の応答時間(秒)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="グラフDB の応答時間のゆらぎ(秒)")
+    parser.add_argument('--rows', type=int, default=1000, help="グラフDB が返却する検索結果の件数")
+    parser.add_argument('--sink-latency', type=float, default=0.0, help="設計支援システムの応答時間(秒)")
+    parser.add_argument('--sink-error-rate', type=float, default=0.0, help="設計支援システムが 500 を返却する割合")
+
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--corpus', help="クエリのコーパス(JSON Lines)")
+    parser.add_argument('--rps', type=float, default=20.0, help="目標のリクエスト数/秒(0 の場合は同時接続数のみで制御)")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help="計測時間(秒)")
+    parser.add_argument('--timeout', type=float, default=30.0)
+
+
+def start_mock(args) -> MockServer:
+    mock = MockServer(
+        args.sparql_port, args.sink_port, args.latency, args.jitter, args.rows,
+        args.sink_latency, args.sink_error_rate)
+    mock.start()
+    return mock
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    mock_parser = subparsers.add_parser('mock', help="グラフDB と設計支援システムのモックを起動する")
+    add_mock_arguments(mock_parser)
+
+    run_parser = subparsers.add_parser('run', help="起動済みの検索APIへ負荷をかける")
+    run_parser.add_argument('--target', action='append', required=True, help="名前=URL (複数指定可)")
+    add_load_arguments(run_parser)
+
+    compare_parser = subparsers.add_parser('compare', help="モック、app_link、WebAPI を起動して比較する")
+    compare_parser.add_argument('--app-link-port', type=int, default=18081)
+    compare_parser.add_argument('--webapi-port', type=int, default=18000)
+    compare_parser.add_argument('--only', choices=['app_link', 'webapi'], action='append')
+    compare_parser.add_argument('--verbose', action='store_true', help="app_link、WebAPI のログを表示する")
+    add_mock_arguments(compare_parser)
+    add_load_arguments(compare_parser)
+
+    serve_parser = subparsers.add_parser('serve-app-link', help=argparse.SUPPRESS)
+    serve_parser.add_argument('--port', type=int, required=True)
+    serve_parser.add_argument('--sparql-url', required=True)
+    serve_parser.add_argument('--sink-url', required=True)
+    serve_parser.add_argument('--timeout', type=float, default=30.0)
+    serve_parser.add_argument('--config', default='config.ini')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve-app-link':
+        serve_app_link(args)
+        return
+
+    if args.command == 'mock':
+        mock = start_mock(args)
+        print(f"sparql: http://localhost:{args.sparql_port}/  design_support: http://localhost:{args.sink_port}/")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            mock.stop()
+        return
+
+    corpus = load_corpus(args.corpus)
+    print(f"queries={len(corpus)} rps={args.rps} concurrency={args.concurrency} duration={args.duration}")
+
+    if args.command == 'run':
+        results = []
+        for target in args.target:
+            name, url = target.split('=', 1)
+            result = run_load(url, corpus, args.rps, args.concurrency, args.duration, args.timeout)
+            result['query_stats'] = get_query_stats(url)
+            results.append((name, result))
+        print_results(results)
+        return
+
+    # compare: 各対象を順に起動し、同じモックに対して計測する
+    here = os.path.dirname(os.path.abspath(__file__))
+    sparql_url = f"http://localhost:{args.sparql_port}/sparql"
+    sink_url = f"http://localhost:{args.sink_port}/catalog/v1/query-response"
+    targets = {
+        'app_link': (
+            [sys.executable, os.path.abspath(__file__), 'serve-app-link', '--port', str(args.app_link_port),
+             '--sparql-url', sparql_url, '--sink-url', sink_url, '--timeout', str(args.timeout)],
+            here, f"http://localhost:{args.app_link_port}"),
+        # WebAPI の SPARQL エンドポイントは http://localhost:8890 固定(--sparql-port を変えた場合は計測できない)
+        'webapi': (
+            [sys.executable, '-m', 'uvicorn', 'WebAPI:app', '--host', 'localhost', '--port', str(args.webapi_port),
+             '--log-level', 'warning'],
+            here, f"http://localhost:{args.webapi_port}"),
+    }
+    mock = start_mock(args)
+    results = []
+    try:
+        for name, (command, cwd, url) in targets.items():
+            if args.only and name not in args.only:
+                continue
+            output = None if args.verbose else subprocess.DEVNULL
+            process = subprocess.Popen(command, cwd=cwd, stdout=output, stderr=output)
+            try:
+                wait_ready(url, process)
+                mock.counts.clear()
+                result = run_load(url, corpus, args.rps, args.concurrency, args.duration, args.timeout)
+                result['query_stats'] = get_query_stats(url)
+                result['mock'] = dict(mock.counts)
+                results.append((name, result))
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        mock.stop()
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""SPARQL の検索結果のデコーダーの処理時間比較.
+
+航路データ(航路・ウェイポイントの種別、日本語ラベル、xsd:decimal の座標、他ドメインへのリンク)を模した
+検索結果を生成し、形式・デコーダー毎にバインディングを全件取り出すまでの時間を計測する。
+
+    $ python bench_sparql_results.py --triples 200000
+"""
+import argparse
+import json
+import time
+from xml.sax.saxutils import escape, quoteattr
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from lib_bulkload import binding_to_ntriple, term_to_nt
+from lib_sparql_results import (
+    SparqlResultsDecoder, available_backends, iter_json_bindings,
+    iter_ntriples_bindings, iter_tsv_bindings, iter_xml_bindings)
+
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+XSD_DECIMAL = "http://www.w3.org/2001/XMLSchema#decimal"
+BASE = "http://airway.example.com/resource/"
+VOCAB = "http://airway.example.com/ontology#"
+
+
+def _uri(value: str) -> dict:
+    return {'type': 'uri', 'value': value}
+
+
+def generate_bindings(triples: int) -> List[dict]:
+    """航路データを模したバインディングを生成する"""
+    bindings = []
+    i = 0
+    while len(bindings) < triples:
+        s = _uri(f"{BASE}waypoint/{i}")
+        bindings.append({'s': s, 'p': _uri(RDF_TYPE), 'o': _uri(f"{VOCAB}Waypoint")})
+        bindings.append({'s': s, 'p': _uri(RDFS_LABEL),
+                         'o': {'type': 'literal', 'value': f"ウェイポイント{i}", 'xml:lang': 'ja'}})
+        bindings.append({'s': s, 'p': _uri(f"{VOCAB}latitude"),
+                         'o': {'type': 'literal', 'value': f"{35 + i % 1000 / 1000:.6f}", 'datatype': XSD_DECIMAL}})
+        bindings.append({'s': s, 'p': _uri(f"{VOCAB}longitude"),
+                         'o': {'type': 'literal', 'value': f"{139 + i % 997 / 1000:.6f}", 'datatype': XSD_DECIMAL}})
+        bindings.append({'s': s, 'p': _uri(f"{VOCAB}linkedTo"),
+                         'o': _uri(f"http://operator{i % 10}.example.com/resource/airway/{i}")})
+        i += 1
+    return bindings[:triples]
+
+
+def to_json(bindings: List[dict]) -> bytes:
+    return json.dumps({'head': {'vars': ['s', 'p', 'o']}, 'results': {'bindings': bindings}},
+                      ensure_ascii=False).encode('utf-8')
+
+
+def to_xml(bindings: List[dict]) -> bytes:
+    lines = ['<?xml version="1.0"?>',
+             '<sparql xmlns="http://www.w3.org/2005/sparql-results#">',
+             '<head><variable name="s"/><variable name="p"/><variable name="o"/></head>',
+             '<results>']
+    for binding in bindings:
+        lines.append('<result>')
+        for name, term in binding.items():
+            if term['type'] == 'uri':
+                value = f"<uri>{escape(term['value'])}</uri>"
+            elif term['type'] == 'bnode':
+                value = f"<bnode>{escape(term['value'])}</bnode>"
+            elif 'xml:lang' in term:
+                value = f"<literal xml:lang={quoteattr(term['xml:lang'])}>{escape(term['value'])}</literal>"
+            elif 'datatype' in term:
+                value = f"<literal datatype={quoteattr(term['datatype'])}>{escape(term['value'])}</literal>"
+            else:
+                value = f"<literal>{escape(term['value'])}</literal>"
+            lines.append(f'<binding name="{name}">{value}</binding>')
+        lines.append('</result>')
+    lines.append('</results></sparql>')
+    return "\n".join(lines).encode('utf-8')
+
+
+def to_tsv(bindings: List[dict]) -> bytes:
+    lines = ["?s\t?p\t?o"]
+    for binding in bindings:
+        lines.append("\t".join(term_to_nt(binding[name]) for name in ('s', 'p', 'o')))
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def to_ntriples(bindings: List[dict]) -> bytes:
+    return ("\n".join(binding_to_ntriple(binding) for binding in bindings) + "\n").encode('utf-8')
+
+
+def chunked(body: bytes, size: int) -> Iterator[bytes]:
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def measure(func: Callable[[], int], repeat: int) -> float:
+    """func を repeat 回実行し、最短の処理時間(秒)を返却する"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--triples', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=65536)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    bindings = generate_bindings(args.triples)
+    bodies = {
+        'json': to_json(bindings),
+        'xml': to_xml(bindings),
+        'tsv': to_tsv(bindings),
+        'ntriples': to_ntriples(bindings),
+    }
+
+    def count(it) -> int:
+        return sum(1 for _ in it)
+
+    # 名前: (形式, 処理)
+    cases: Dict[str, Tuple[str, Callable[[], int]]] = {
+        'json (一括)': ('json', lambda: len(json.loads(bodies['json'])['results']['bindings'])),
+        'json (逐次)': ('json', lambda: count(iter_json_bindings(chunked(bodies['json'], args.chunk_size)))),
+    }
+    decoder = SparqlResultsDecoder('auto')
+    cases['auto (iter_bindings)'] = (
+        'json', lambda d=decoder: count(d.iter_bindings(chunked(bodies['json'], args.chunk_size))))
+    for backend in available_backends():
+        if backend == 'json':
+            continue
+        decoder = SparqlResultsDecoder(backend)
+        cases[f'{backend} (一括)'] = (
+            'json', lambda d=decoder: len(d.loads(bodies['json'])['results']['bindings']))
+        cases[f'{backend} (iter_bindings)'] = (
+            'json', lambda d=decoder: count(d.iter_bindings(chunked(bodies['json'], args.chunk_size))))
+    cases['xml (逐次)'] = ('xml', lambda: count(iter_xml_bindings(chunked(bodies['xml'], args.chunk_size))))
+    cases['tsv (逐次)'] = ('tsv', lambda: count(iter_tsv_bindings(chunked(bodies['tsv'], args.chunk_size))))
+    cases['ntriples (逐次)'] = (
+        'ntriples', lambda: count(iter_ntriples_bindings(chunked(bodies['ntriples'], args.chunk_size))))
+
+    print(f"triples={args.triples} chunk_size={args.chunk_size} repeat={args.repeat}")
+    print(f"{'デコーダー':<24}{'サイズ(MB)':>12}{'時間(秒)':>12}{'件/秒':>14}")
+    for name, (fmt, func) in cases.items():
+        elapsed = measure(func, args.repeat)
+        print(f"{name:<24}{len(bodies[fmt]) / 1024 / 1024:>12.1f}{elapsed:>12.3f}{args.triples / elapsed:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
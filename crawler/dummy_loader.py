@@ -0,0 +1,90 @@
+"""Neptune ローダーAPI のローカル代替サーバー(バルクロードの動作確認用).
+
+ステージングファイルを rdflib で読み込み、ロードジョブとして処理結果を返却する。
+`--sparql-update` を指定した場合は、読み込んだトリプルを SPARQL UPDATE で登録する(N-Triples のみ)。
+
+    $ python dummy_loader.py --port 8182
+    config.ini の BULKLOAD_LOADER_URL に http://localhost:8182/loader を指定する
+"""
+from flask import Flask, request, jsonify
+from rdflib import Dataset, Graph
+
+import argparse
+import logging
+import os
+import threading
+import urllib.parse
+import uuid
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+jobs = {}
+jobs_lock = threading.Lock()
+sparql_update_url = None
+
+
+def run_job(load_id: str, source: str, format: str):
+    path = urllib.parse.urlparse(source).path if source.startswith('file://') else source
+    status = {"status": "LOAD_IN_PROGRESS", "totalRecords": 0, "parsingErrors": 0}
+    with jobs_lock:
+        jobs[load_id] = status
+    try:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ソースファイルが見つかりません: {source}")
+        if format == "nquads":
+            graph = Dataset()
+            graph.parse(path, format="nquads")
+            total = sum(1 for _ in graph.quads((None, None, None, None)))
+        else:
+            graph = Graph()
+            graph.parse(path, format="nt")
+            total = len(graph)
+        if sparql_update_url:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read()
+            response = requests.post(
+                sparql_update_url, data=f"INSERT DATA {{ {lines} }}",
+                headers={'Content-Type': 'application/sparql-update'})
+            if response.status_code != 200:
+                raise ValueError(f"SPARQL UPDATE に失敗しました: {response.status_code}")
+        status.update(status="LOAD_COMPLETED", totalRecords=total)
+    except Exception as e:
+        logger.error(f"load failed {load_id=} {str(e)}")
+        status.update(status="LOAD_FAILED", parsingErrors=1, error=str(e))
+
+
+@app.route('/loader', methods=['POST'])
+def submit():
+    body = request.get_json()
+    if not body or 'source' not in body:
+        return jsonify({"code": "BadRequestException", "detailedMessage": "source is required"}), 400
+    load_id = str(uuid.uuid4())
+    with jobs_lock:
+        jobs[load_id] = {"status": "LOAD_NOT_STARTED", "totalRecords": 0, "parsingErrors": 0}
+    threading.Thread(
+        target=run_job, args=(load_id, body['source'], body.get('format', 'ntriples'))).start()
+    return jsonify({"status": "200 OK", "payload": {"loadId": load_id}})
+
+
+@app.route('/loader/<load_id>', methods=['GET'])
+def status(load_id: str):
+    with jobs_lock:
+        job = jobs.get(load_id)
+    if job is None:
+        return jsonify({"code": "LoadNotFoundException", "detailedMessage": load_id}), 404
+    return jsonify({"status": "200 OK", "payload": {"overallStatus": dict(job)}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8182)
+    parser.add_argument('--sparql-update', default=None)
+    args = parser.parse_args()
+    sparql_update_url = args.sparql_update
+
+    logging.basicConfig(level=logging.INFO)
+    app.run(port=args.port, host='0.0.0.0')
@@ -0,0 +1,170 @@
+"""グラフDB(AWS Neptune) のバルクローダーによる一括登録モジュール.
+
+ドメイン毎のトリプルを N-Triples / N-Quads のステージングファイルに書き出し、
+ローダーAPIへロードジョブを登録して、完了するまでステータスを確認する。
+SPARQL で登録する場合と同じく、N-Quads でも既定のグラフへ登録する。
+"""
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+import requests
+from lib_sparql_results import iter_ntriples_bindings
+
+
+logger = logging.getLogger(__name__)
+
+# ロードジョブが実行中であることを示すステータス(これ以外は終了状態)
+LOAD_RUNNING_STATUSES = ("LOAD_NOT_STARTED", "LOAD_IN_QUEUE", "LOAD_IN_PROGRESS")
+LOAD_COMPLETED = "LOAD_COMPLETED"
+
+
+def _escape_literal(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def term_to_nt(term: dict) -> str:
+    """SPARQL JSON の値を N-Triples の項に変換する"""
+    if term['type'] == 'uri':
+        return f"<{term['value']}>"
+    if term['type'] == 'bnode':
+        return f"_:{term['value']}"
+    literal = f'"{_escape_literal(term["value"])}"'
+    if 'xml:lang' in term:
+        return f"{literal}@{term['xml:lang']}"
+    if 'datatype' in term:
+        return f"{literal}^^<{term['datatype']}>"
+    return literal
+
+
+def iter_staging_bindings(path: str, chunk_size: int = 65536) -> Iterator[dict]:
+    """ステージングファイルのトリプルを SPARQL JSON のバインディング形式で一行ずつ返却する"""
+    with open(path, 'rb') as f:
+        yield from iter_ntriples_bindings(iter(lambda: f.read(chunk_size), b''))
+
+
+def binding_to_ntriple(triple: dict, graph: Optional[str] = None) -> str:
+    """SPARQL JSON のバインディング(?s ?p ?o) を N-Triples (graph 指定時は N-Quads) の1行に変換する"""
+    terms = [term_to_nt(triple['s']), term_to_nt(triple['p']), term_to_nt(triple['o'])]
+    if graph:
+        terms.append(f"<{graph}>")
+    return " ".join(terms) + " ."
+
+
+class BulkLoader:
+    """Neptune のローダーAPI を使ってトリプルを一括登録する
+
+    ステージングディレクトリは、ローダーが読み込める場所(S3 と同期するディレクトリなど)とし、
+    ローダーへは source_prefix + ファイル名 をソースとして指定する。
+    source_prefix が空の場合はステージングファイルのパスをそのまま指定する(ローカルのローダー向け)。
+    """
+
+    def __init__(
+            self,
+            loader_url: str,
+            staging_dir: str,
+            source_prefix: str = "",
+            format: str = "ntriples",
+            iam_role_arn: str = "",
+            region: str = "",
+            poll_interval: float = 5.0,
+            timeout: float = 3600.0):
+        self.loader_url = loader_url.rstrip('/')
+        self.staging_dir = staging_dir
+        self.source_prefix = source_prefix
+        self.format = format
+        self.iam_role_arn = iam_role_arn
+        self.region = region
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        # ドメイン毎の直近のロード結果(app_link の /v1/api/bulkLoads で返却する)
+        self.results: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def open_staging_file(self, domain: str) -> Tuple[str, TextIO]:
+        """ステージングファイルを作成し、ファイル名と書き込み用のファイルオブジェクトを返却する"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        ext = "nq" if self.format == "nquads" else "nt"
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', domain)
+        filename = f"{name}-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.{ext}"
+        return filename, open(self.staging_path(filename), 'w', encoding='utf-8')
+
+    def write_staging(self, f: TextIO, bindings: List[dict]):
+        """トリプルをステージングファイルへ追記する(N-Quads の場合もグラフは指定せず、既定のグラフへ登録する)"""
+        for triple in bindings:
+            f.write(binding_to_ntriple(triple))
+            f.write("\n")
+
+    def staging_path(self, filename: str) -> str:
+        return os.path.join(self.staging_dir, filename)
+
+    def remove_staging(self, filename: str):
+        """登録が終わった(または不要になった) ステージングファイルを削除する"""
+        try:
+            os.remove(self.staging_path(filename))
+        except FileNotFoundError:
+            pass
+
+    def submit(self, source: str) -> str:
+        """ロードジョブを登録し、ロードIDを返却する"""
+        body = {
+            "source": source,
+            "format": self.format,
+            "failOnError": "TRUE",
+        }
+        if self.iam_role_arn:
+            body["iamRoleArn"] = self.iam_role_arn
+        if self.region:
+            body["region"] = self.region
+        response = requests.post(self.loader_url, json=body, timeout=30)
+        if response.status_code != 200:
+            raise ValueError(f"ロードジョブの登録に失敗しました: {response.status_code} {response.text}")
+        return response.json()["payload"]["loadId"]
+
+    def wait(self, load_id: str) -> dict:
+        """ロードジョブが終了するまでステータスを確認し、終了時のステータスを返却する"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            response = requests.get(f"{self.loader_url}/{load_id}", timeout=30)
+            if response.status_code != 200:
+                raise ValueError(f"ロードジョブのステータス取得に失敗しました: {response.status_code} {response.text}")
+            overall = response.json()["payload"]["overallStatus"]
+            if overall["status"] not in LOAD_RUNNING_STATUSES:
+                return overall
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"ロードジョブ {load_id} が {self.timeout} 秒以内に終了しませんでした")
+            time.sleep(self.poll_interval)
+
+    def load_staged(self, domain: str, filename: str, triples: int) -> dict:
+        """書き出し済みのステージングファイルを一括登録し、ロード結果を返却する"""
+        result = {"domain": domain, "triples": triples, "load_id": None, "status": None}
+        try:
+            if self.source_prefix:
+                source = f"{self.source_prefix.rstrip('/')}/{filename}"
+            else:
+                source = os.path.abspath(self.staging_path(filename))
+            result["source"] = source
+            result["load_id"] = self.submit(source)
+            logger.info(f"bulk load submitted {domain=} {result['load_id']=} {source=}")
+            overall = self.wait(result["load_id"])
+            result["status"] = overall["status"]
+            result["total_records"] = overall.get("totalRecords")
+            result["parsing_errors"] = overall.get("parsingErrors")
+        except Exception as e:
+            result["status"] = "ERROR"
+            result["error"] = str(e)
+        with self.lock:
+            self.results[domain] = result
+        if result["status"] == LOAD_COMPLETED:
+            logger.info(f"bulk load completed {result=}")
+        else:
+            logger.error(f"バルクロードに失敗しました: {result=}")
+        return result
+
+    def get_results(self) -> Dict[str, dict]:
+        with self.lock:
+            return dict(self.results)
@@ -0,0 +1,269 @@
+"""クロールによるグラフDBの変更履歴(チェンジフィード) モジュール.
+
+ドメイン毎に前回クロール時のトリプル(N-Triples) をスナップショットとして保存し、
+今回のクロールとの差分(追加・削除されたトリプル) を追記専用の JSON Lines ファイルへ記録する。
+クロール周期の終了時には、周期内で変更のあったドメインとトリプル数をまとめたレコードを記録する。
+
+レコードの位置(ファイル先頭からのバイト数) をカーソルとし、利用者はカーソル以降の差分のみを取得できる。
+分散クローリングのワーカープロセスからも書き込むため、書き込みはファイルロックで排他する。
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from lib_bulkload import binding_to_ntriple
+
+
+logger = logging.getLogger(__name__)
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime(DATETIME_FORMAT)
+
+
+class InvalidCursor(ValueError):
+    """カーソルがレコードの位置ではない"""
+
+
+class DomainChangeset:
+    """1ドメイン分のクロールで受け取ったトリプルを、前回のスナップショットと比較する"""
+
+    def __init__(self, changelog: 'ChangeLog', domain: str, endpoint: str):
+        self.changelog = changelog
+        self.domain = domain
+        self.endpoint = endpoint
+        self.path = changelog.snapshot_path(domain)
+        self.tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.f = open(self.tmp_path, 'w', encoding='utf-8')
+        self.hashes: Set[int] = set()
+
+    def add(self, bindings: List[dict]):
+        for triple in bindings:
+            line = binding_to_ntriple(triple)
+            h = hash(line)
+            if h in self.hashes:
+                continue
+            self.hashes.add(h)
+            self.f.write(line)
+            self.f.write("\n")
+
+    def _old_hashes(self) -> Set[int]:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return {hash(line.rstrip('\n')) for line in f}
+
+    def commit(self) -> Tuple[int, List[str]]:
+        """差分を変更履歴へ記録してスナップショットを置き換え、追加したトリプル数と削除されたトリプル(N-Triples) を返却する"""
+        self.f.close()
+        old_hashes = self._old_hashes()
+        removed = []
+        if old_hashes:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                removed = [line.rstrip('\n') for line in f if hash(line.rstrip('\n')) not in self.hashes]
+
+        def iter_added() -> Iterator[str]:
+            with open(self.tmp_path if os.path.exists(self.tmp_path) else self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.rstrip('\n')
+                    if hash(line) not in old_hashes:
+                        yield line
+
+        timestamp = _now()
+        added = self.changelog.append_domain(self.domain, self.endpoint, iter_added(), removed, timestamp)
+        os.replace(self.tmp_path, self.path)
+        for listener in self.changelog.listeners:
+            try:
+                listener(self.domain, self.path, iter_added(), removed, timestamp)
+            except Exception as e:
+                logger.error(f"変更履歴のリスナーでエラーが発生しました: {self.domain=} {str(e)}")
+        return added, removed
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class ChangeLog:
+    """追記専用の変更履歴
+
+    レコードは以下の2種類とする。
+    * {"type": "domain", "domain": ..., "endpoint": ..., "timestamp": ..., "added": [N-Triples], "removed": [N-Triples]}
+      (トリプル数が record_size を超える場合は、複数のレコードに分けて連続して記録する)
+    * {"type": "cycle", "cycle_id": ..., "timestamp": ..., "domains": {ドメイン: {"added": 件数, "removed": 件数}}}
+
+    最終クロール日時(全体とドメイン毎) は {path}.state.json に記録する。
+
+    listeners には、ドメインの差分を記録する毎に
+    listener(ドメイン, スナップショットのパス, 追加されたトリプル, 削除されたトリプル, 日時) として呼び出す関数を登録する。
+    """
+
+    def __init__(self, path: str, snapshot_dir: str, record_size: int = 10000):
+        self.path = path
+        self.snapshot_dir = snapshot_dir
+        self.record_size = record_size
+        self.state_path = f"{path}.state.json"
+        self._state_cache: Optional[Tuple[float, Dict]] = None
+        self.listeners: List[Callable[[str, str, Iterator[str], List[str], str], None]] = []
+
+    def snapshot_path(self, domain: str) -> str:
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', domain)
+        return os.path.join(self.snapshot_dir, f"{name}.nt")
+
+    def published_elsewhere(self, domain: str, lines: List[str]) -> Set[str]:
+        """lines のうち、他のドメインのスナップショット(クロール中のものを含む) にも含まれるトリプルを返却する"""
+        own = self.snapshot_path(domain)
+        remaining = set(lines)
+        found: Set[str] = set()
+        if not remaining or not os.path.isdir(self.snapshot_dir):
+            return found
+        for name in os.listdir(self.snapshot_dir):
+            path = os.path.join(self.snapshot_dir, name)
+            if not name.endswith(('.nt', '.nt.tmp')) or path in (own, f"{own}.tmp"):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.rstrip('\n')
+                        if line in remaining:
+                            remaining.discard(line)
+                            found.add(line)
+            except FileNotFoundError:
+                # クロール中のスナップショットは読み込み中に置き換えられることがある
+                continue
+            if not remaining:
+                break
+        return found
+
+    def open_changeset(self, domain: str, endpoint: str) -> DomainChangeset:
+        return DomainChangeset(self, domain, endpoint)
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_state(self) -> Dict:
+        if not os.path.exists(self.state_path):
+            return {'last_crawl': None, 'domains': {}, 'pending': {}}
+        with open(self.state_path, 'r') as f:
+            return json.load(f)
+
+    def _write_state(self, state: Dict):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _write_record(self, f, record: Dict):
+        f.write(json.dumps(record, ensure_ascii=False))
+        f.write("\n")
+
+    def append_domain(
+            self, domain: str, endpoint: str, added: Iterator[str], removed: List[str],
+            timestamp: Optional[str] = None) -> int:
+        """ドメインの差分を記録し、追加したトリプル数を返却する(差分がない場合はクロール日時のみ記録する)"""
+        timestamp = timestamp or _now()
+        count = 0
+        with self._locked():
+            with open(self.path, 'a', encoding='utf-8') as f:
+                def write(added_lines: List[str], removed_lines: List[str]):
+                    self._write_record(f, {
+                        'type': 'domain', 'domain': domain, 'endpoint': endpoint, 'timestamp': timestamp,
+                        'added': added_lines, 'removed': removed_lines})
+
+                for i in range(0, len(removed), self.record_size):
+                    write([], removed[i:i + self.record_size])
+                chunk = []
+                for line in added:
+                    chunk.append(line)
+                    count += 1
+                    if len(chunk) >= self.record_size:
+                        write(chunk, [])
+                        chunk = []
+                if chunk:
+                    write(chunk, [])
+                f.flush()
+                os.fsync(f.fileno())
+
+            state = self._read_state()
+            state['domains'][domain] = timestamp
+            if count or removed:
+                pending = state['pending'].setdefault(domain, {'added': 0, 'removed': 0})
+                pending['added'] += count
+                pending['removed'] += len(removed)
+            self._write_state(state)
+        logger.info(f"changelog {domain=} added={count} removed={len(removed)}")
+        return count
+
+    def complete_cycle(self, cycle_id: str):
+        """クロール周期の終了を記録する"""
+        timestamp = _now()
+        with self._locked():
+            state = self._read_state()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                self._write_record(f, {
+                    'type': 'cycle', 'cycle_id': cycle_id, 'timestamp': timestamp, 'domains': state['pending']})
+            state['last_crawl'] = timestamp
+            state['pending'] = {}
+            self._write_state(state)
+
+    def get_state(self) -> Dict:
+        """最終クロール日時を返却する(ファイルが更新されていなければ前回読み込んだ内容を返却する)"""
+        if not os.path.exists(self.state_path):
+            return self._read_state()
+        mtime = os.path.getmtime(self.state_path)
+        if self._state_cache is None or self._state_cache[0] != mtime:
+            self._state_cache = (mtime, self._read_state())
+        return self._state_cache[1]
+
+    def last_modified(self, domain: Optional[str] = None) -> Optional[str]:
+        """最終クロール日時(domain を指定した場合はそのドメインの最終クロール日時)"""
+        state = self.get_state()
+        if domain:
+            return state['domains'].get(domain)
+        return state['last_crawl']
+
+    def read_since(self, cursor: int = 0, domain: Optional[str] = None) -> Iterator[Tuple[int, str]]:
+        """カーソル以降のレコードを、次のカーソルと JSON 文字列の組で一つずつ返却する
+
+        domain を指定した場合は、そのドメインのレコードとクロール周期のレコードのみ返却する。
+        """
+        if not os.path.exists(self.path):
+            if cursor:
+                raise InvalidCursor(f"カーソル {cursor} は変更履歴の範囲外です")
+            return
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            if cursor < 0 or cursor > size:
+                raise InvalidCursor(f"カーソル {cursor} は変更履歴の範囲外です")
+            if cursor > 0:
+                f.seek(cursor - 1)
+                if f.read(1) != b"\n":
+                    raise InvalidCursor(f"カーソル {cursor} はレコードの位置ではありません")
+            position = cursor
+            for line in f:
+                # 書き込み途中のレコードは返却しない
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                record = line.decode('utf-8').rstrip('\n')
+                if domain:
+                    data = json.loads(record)
+                    if data['type'] == 'domain' and data['domain'] != domain:
+                        continue
+                yield position, record
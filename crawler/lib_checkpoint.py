@@ -0,0 +1,122 @@
+"""クローリングのチェックポイント管理モジュール.
+
+クロール周期の途中でプロセスが停止しても再開できるよう、
+フロンティア(これからクロールするエンドポイント)、クロール済みドメイン、
+ドメイン毎の登録済みトリプル数をファイルへ記録する。
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def new_cycle_id() -> str:
+    """クロール周期のIDを発行する"""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class CrawlCheckpoint:
+    def __init__(
+            self,
+            path: str,
+            endpoint_list: List[str],
+            last_updated: datetime,
+            cycle_id: Optional[str] = None,
+            interval: float = 10.0):
+        self.path = path
+        self.cycle_id = cycle_id or new_cycle_id()
+        self.endpoint_list = list(endpoint_list)
+        self.last_updated = last_updated
+        self.frontier: List[str] = list(endpoint_list)
+        self.completed: List[str] = []
+        # ドメイン毎の登録済みトリプル数と、その時点の航路運営者の更新日時
+        self.offsets: Dict[str, Dict] = {}
+        self.interval = interval
+        self.saved_at = 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> Optional['CrawlCheckpoint']:
+        """中断されたクロール周期のチェックポイントを読み込む(存在しない場合は None)"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            checkpoint = cls(
+                path, data['endpoint_list'],
+                datetime.strptime(data['last_updated'], DATETIME_FORMAT),
+                cycle_id=data['cycle_id'])
+            checkpoint.frontier = data['frontier']
+            checkpoint.completed = data['completed']
+            checkpoint.offsets = data['offsets']
+        except Exception as e:
+            logger.error(f"チェックポイント {path} を読み込めませんでした: {str(e)}")
+            return None
+        return checkpoint
+
+    def save(self):
+        """チェックポイントをファイルへ書き込む(書き込み途中で停止しても壊れないよう置き換えで書き込む)"""
+        with self.lock:
+            data = {
+                'cycle_id': self.cycle_id,
+                'endpoint_list': self.endpoint_list,
+                'last_updated': self.last_updated.strftime(DATETIME_FORMAT),
+                'frontier': list(self.frontier),
+                'completed': list(self.completed),
+                'offsets': self.offsets,
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.saved_at = time.monotonic()
+
+    def maybe_save(self):
+        """前回の書き込みから interval 秒以上経過していれば書き込む"""
+        if time.monotonic() - self.saved_at >= self.interval:
+            self.save()
+
+    def clear(self):
+        """クロール周期が完了したらチェックポイントを削除する"""
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def set_frontier(self, frontier: List[str]):
+        with self.lock:
+            self.frontier = list(frontier)
+
+    def add_endpoint(self, endpoint: str):
+        """クロール周期の途中でキューから取り出したエンドポイントを記録する"""
+        with self.lock:
+            if endpoint not in self.endpoint_list:
+                self.endpoint_list.append(endpoint)
+
+    def complete(self, domain: str):
+        with self.lock:
+            if domain not in self.completed:
+                self.completed.append(domain)
+            self.offsets.pop(domain, None)
+
+    def get_offset(self, domain: str, last_modified: Optional[str]) -> int:
+        """登録済みトリプル数を返却する(航路運営者のデータが更新されていれば先頭からやり直す)"""
+        entry = self.offsets.get(domain)
+        if entry is None or entry.get('last_modified') != last_modified:
+            return 0
+        return entry['offset']
+
+    def record_offset(self, domain: str, last_modified: Optional[str], offset: int):
+        with self.lock:
+            self.offsets[domain] = {'offset': offset, 'last_modified': last_modified}
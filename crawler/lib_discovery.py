@@ -0,0 +1,166 @@
+"""ディスカバリーファインダーによるエンドポイント解決モジュール.
+
+ドメイン(航路運営者) 毎の SPARQL エンドポイントと更新日時のエンドポイントを、
+ディスカバリーファインダーへ問い合わせて取得する。
+
+    GET {DISCOVERY_FINDER_URL}{DISCOVERY_RESOLVE_PATH}?domain=<ドメイン>&service=<DISCOVERY_SERVICE_DOMAIN>
+    => {"sparqlEndpoint": "https://...", "lastModifiedEndpoint": "https://..."}
+
+解決結果は ttl 秒キャッシュする。ファインダーが知らないドメイン(404) や、ファインダーへ到達できない場合は
+negative_ttl 秒の間は問い合わせず、従来どおり http://{ドメイン}/api/sparql/query を使う。
+"""
+import logging
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+SPARQL_PATH = "api/sparql/query"
+LAST_MODIFIED_PATH = "api/metadata/last-modified"
+
+
+class ResolvedEndpoint:
+    """ドメインのエンドポイント
+
+    source は finder (ディスカバリーファインダーから取得) または template (ドメイン名から推測) とする。
+    """
+
+    def __init__(self, domain: str, sparql_url: str, last_modified_url: str, source: str):
+        self.domain = domain
+        self.sparql_url = sparql_url
+        self.last_modified_url = last_modified_url
+        self.source = source
+
+    @classmethod
+    def from_template(cls, domain: str) -> 'ResolvedEndpoint':
+        return cls(domain, f"http://{domain}/{SPARQL_PATH}", f"http://{domain}/{LAST_MODIFIED_PATH}", "template")
+
+    def as_dict(self) -> Dict:
+        return {
+            'domain': self.domain,
+            'sparql_url': self.sparql_url,
+            'last_modified_url': self.last_modified_url,
+            'source': self.source,
+        }
+
+
+class EndpointResolver:
+    """ディスカバリーファインダーへの問い合わせ結果をキャッシュするエンドポイント解決"""
+
+    def __init__(
+            self,
+            finder_url: str,
+            service_domain: str = "",
+            resolve_path: str = "/v1/api/endpoints",
+            ttl: float = 3600.0,
+            negative_ttl: float = 300.0,
+            timeout: float = 5.0,
+            max_workers: int = 8):
+        self.finder_url = (finder_url or "").rstrip('/')
+        self.service_domain = service_domain
+        self.resolve_path = resolve_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_workers = max_workers
+        # ドメイン毎の解決結果(ファインダーから取得できなかった場合は None) と有効期限
+        self.cache: Dict[str, Tuple[Optional[ResolvedEndpoint], float]] = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'negative_hits': 0, 'lookups': 0, 'failures': 0}
+
+    def _cached(self, domain: str) -> Tuple[bool, Optional[ResolvedEndpoint]]:
+        with self.lock:
+            entry = self.cache.get(domain)
+            if entry is None or entry[1] < time.monotonic():
+                return False, None
+            self.stats['hits' if entry[0] is not None else 'negative_hits'] += 1
+            return True, entry[0]
+
+    def _store(self, domain: str, resolved: Optional[ResolvedEndpoint]):
+        ttl = self.ttl if resolved is not None else self.negative_ttl
+        with self.lock:
+            self.cache[domain] = (resolved, time.monotonic() + ttl)
+
+    def _lookup(self, domain: str) -> Optional[ResolvedEndpoint]:
+        """ディスカバリーファインダーへ問い合わせる(取得できなかった場合は None)"""
+        with self.lock:
+            self.stats['lookups'] += 1
+        params = {'domain': domain}
+        if self.service_domain:
+            params['service'] = self.service_domain
+        try:
+            response = requests.get(f"{self.finder_url}{self.resolve_path}", params=params, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"ディスカバリーファインダーへ到達できませんでした: {domain=} {str(e)}")
+            with self.lock:
+                self.stats['failures'] += 1
+            return None
+        if response.status_code == 404:
+            logger.info(f"ディスカバリーファインダーに登録されていないドメインです: {domain=}")
+            return None
+        if response.status_code != 200:
+            logger.warning(f"ディスカバリーファインダーの応答が不正です: {domain=} {response.status_code} {response.text}")
+            with self.lock:
+                self.stats['failures'] += 1
+            return None
+        try:
+            body = response.json()
+            sparql_url = body['sparqlEndpoint']
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"ディスカバリーファインダーの応答を解析できませんでした: {domain=} {str(e)}")
+            with self.lock:
+                self.stats['failures'] += 1
+            return None
+        last_modified_url = body.get('lastModifiedEndpoint')
+        if not last_modified_url:
+            u = urllib.parse.urlparse(sparql_url)
+            last_modified_url = f"{u.scheme}://{u.netloc}/{LAST_MODIFIED_PATH}"
+        return ResolvedEndpoint(domain, sparql_url, last_modified_url, "finder")
+
+    def resolve(self, domain: str) -> ResolvedEndpoint:
+        """ドメインのエンドポイントを返却する(ファインダーから取得できない場合はドメイン名から推測する)"""
+        if not self.finder_url:
+            return ResolvedEndpoint.from_template(domain)
+        found, resolved = self._cached(domain)
+        if not found:
+            resolved = self._lookup(domain)
+            self._store(domain, resolved)
+        return resolved or ResolvedEndpoint.from_template(domain)
+
+    def resolve_many(self, domains: Iterable[str]) -> Dict[str, ResolvedEndpoint]:
+        """複数のドメインのエンドポイントを返却する(キャッシュにないドメインは並行して問い合わせる)"""
+        domains = list(dict.fromkeys(domains))
+        if not self.finder_url:
+            return {domain: ResolvedEndpoint.from_template(domain) for domain in domains}
+        results = {}
+        missing = []
+        for domain in domains:
+            found, resolved = self._cached(domain)
+            if found:
+                results[domain] = resolved or ResolvedEndpoint.from_template(domain)
+            else:
+                missing.append(domain)
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                for domain, resolved in zip(missing, executor.map(self._lookup, missing)):
+                    self._store(domain, resolved)
+                    results[domain] = resolved or ResolvedEndpoint.from_template(domain)
+        return results
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, cached=len(self.cache))
+
+    def get_endpoints(self) -> List[Dict]:
+        """キャッシュしている(期限切れでない)解決済みのエンドポイントを返却する"""
+        now = time.monotonic()
+        with self.lock:
+            return [
+                resolved.as_dict() for resolved, expires_at in self.cache.values()
+                if resolved is not None and expires_at >= now]
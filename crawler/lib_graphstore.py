@@ -0,0 +1,302 @@
+"""グラフDB(トリプルストア) のバックエンド抽象化モジュール.
+
+クローラと app_link が利用するグラフDBを URL で切り替える。
+
+* http://, https://     : SPARQL エンドポイント(AWS Neptune など)
+* memory:// , memory://名前 : プロセス内のインメモリストア
+* file:///パス         : 組み込みの永続ストア(pyoxigraph がインストールされていれば Oxigraph、
+                          なければ rdflib + N-Quads ファイル)
+
+同じ URL に対しては同じストアを返却するため、同一プロセス内のクローラと app_link は
+インメモリストアを共有できる。
+"""
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Union
+
+import requests
+from rdflib import BNode, Dataset, Literal, URIRef
+from rdflib.graph import DATASET_DEFAULT_GRAPH_ID
+
+from lib_bulkload import binding_to_ntriple
+
+try:
+    import pyoxigraph
+except ImportError:
+    pyoxigraph = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class GraphStoreError(Exception):
+    """グラフDBの操作に失敗した"""
+
+
+def binding_to_term(term: dict):
+    """SPARQL JSON の値を rdflib の項に変換する"""
+    if term['type'] == 'uri':
+        return URIRef(term['value'])
+    if term['type'] == 'bnode':
+        return BNode(term['value'])
+    datatype = term.get('datatype')
+    return Literal(term['value'], lang=term.get('xml:lang'), datatype=URIRef(datatype) if datatype else None)
+
+
+def _update_body(triples: List[dict], graph: Optional[str]) -> str:
+    data = "\n".join(binding_to_ntriple(triple) for triple in triples)
+    if graph:
+        return f"GRAPH <{graph}> {{ {data} }}"
+    return data
+
+
+class GraphStore(ABC):
+    """グラフDBのバックエンドの基底クラス
+
+    トリプルは SPARQL JSON のバインディング形式({'s': {...}, 'p': {...}, 'o': {...}})で受け取る。
+    query は SELECT / ASK の場合 SPARQL JSON の結果を、CONSTRUCT / DESCRIBE の場合 N-Triples を返却する。
+    """
+
+    @abstractmethod
+    def insert_batch(self, triples: List[dict], graph: Optional[str] = None):
+        pass
+
+    @abstractmethod
+    def delete(self, triples: List[dict], graph: Optional[str] = None):
+        pass
+
+    @abstractmethod
+    def drop_graph(self, graph: str):
+        pass
+
+    @abstractmethod
+    def query(self, sparql: str) -> Union[dict, str]:
+        pass
+
+
+class RemoteSparqlStore(GraphStore):
+    """SPARQL エンドポイント(HTTP) のグラフDB"""
+
+    def __init__(self, update_url: str, query_url: Optional[str] = None, timeout: float = 60.0):
+        self.update_url = update_url
+        self.query_url = query_url or update_url
+        self.timeout = timeout
+
+    def update(self, sparql: str):
+        headers = {
+            'Content-Type': 'application/sparql-update'
+        }
+        try:
+            response = requests.post(self.update_url, data=sparql.encode('utf-8'), headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise GraphStoreError(f"グラフDB {self.update_url} へ到達できませんでした: {str(e)}")
+        if response.status_code != 200:
+            raise GraphStoreError(f"Failed to update data. Status code: {response.status_code}\n{response.text}")
+
+    def insert_batch(self, triples: List[dict], graph: Optional[str] = None):
+        if triples:
+            self.update(f"INSERT DATA {{ {_update_body(triples, graph)} }}")
+
+    def delete(self, triples: List[dict], graph: Optional[str] = None):
+        if triples:
+            self.update(f"DELETE DATA {{ {_update_body(triples, graph)} }}")
+
+    def drop_graph(self, graph: str):
+        self.update(f"DROP SILENT GRAPH <{graph}>")
+
+    def query(self, sparql: str) -> Union[dict, str]:
+        headers = {
+            'Accept': 'application/sparql-results+json, application/n-triples;q=0.9'
+        }
+        try:
+            response = requests.get(self.query_url, params={'query': sparql}, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise GraphStoreError(f"グラフDB {self.query_url} へ到達できませんでした: {str(e)}")
+        if response.status_code != 200:
+            raise GraphStoreError(f"Failed to query data. Status code: {response.status_code}\n{response.text}")
+        if 'json' in response.headers.get('Content-Type', ''):
+            return response.json()
+        return response.text
+
+
+class RdflibStore(GraphStore):
+    """rdflib によるインメモリのグラフDB
+
+    path を指定した場合は N-Quads ファイルに永続化する。
+    登録はグラフにないトリプルのみの追記、削除はファイル全体の書き直しとなる
+    (クロール周期毎に同じトリプルを登録し直してもファイルは大きくならない)。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.dataset = Dataset(default_union=True)
+        self.lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.dataset.parse(path, format='nquads')
+            # 読み込み直すと空白ノードのラベルが変わり、再起動の度に同じトリプルが追記されるため、重複があれば書き直す
+            with open(path, 'rb') as f:
+                lines = sum(1 for line in f if line.strip())
+            if lines > sum(len(g) for g in self.dataset.contexts()):
+                self._rewrite()
+
+    def _graph(self, graph: Optional[str]):
+        return self.dataset.graph(URIRef(graph) if graph else DATASET_DEFAULT_GRAPH_ID)
+
+    def _append(self, triples: List[dict], graph: Optional[str]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for triple in triples:
+                f.write(binding_to_ntriple(triple, graph))
+                f.write("\n")
+
+    def _rewrite(self):
+        tmp_path = f"{self.path}.tmp"
+        self.dataset.serialize(tmp_path, format='nquads')
+        os.replace(tmp_path, self.path)
+
+    def insert_batch(self, triples: List[dict], graph: Optional[str] = None):
+        with self.lock:
+            g = self._graph(graph)
+            added = []
+            for triple in triples:
+                t = (binding_to_term(triple['s']), binding_to_term(triple['p']), binding_to_term(triple['o']))
+                if t in g:
+                    continue
+                g.add(t)
+                added.append(triple)
+            if self.path and added:
+                self._append(added, graph)
+
+    def delete(self, triples: List[dict], graph: Optional[str] = None):
+        with self.lock:
+            g = self._graph(graph)
+            for triple in triples:
+                g.remove((binding_to_term(triple['s']), binding_to_term(triple['p']), binding_to_term(triple['o'])))
+            if self.path:
+                self._rewrite()
+
+    def drop_graph(self, graph: str):
+        with self.lock:
+            self.dataset.remove_graph(URIRef(graph))
+            if self.path:
+                self._rewrite()
+
+    def query(self, sparql: str) -> Union[dict, str]:
+        with self.lock:
+            result = self.dataset.query(sparql)
+            if result.type in ('SELECT', 'ASK'):
+                return json.loads(result.serialize(format='json'))
+            return result.serialize(format='nt').decode('utf-8')
+
+
+class OxigraphStore(GraphStore):
+    """pyoxigraph による組み込みの永続グラフDB"""
+
+    def __init__(self, path: str):
+        self.store = pyoxigraph.Store(path)
+
+    def insert_batch(self, triples: List[dict], graph: Optional[str] = None):
+        if triples:
+            self.store.update(f"INSERT DATA {{ {_update_body(triples, graph)} }}")
+
+    def delete(self, triples: List[dict], graph: Optional[str] = None):
+        if triples:
+            self.store.update(f"DELETE DATA {{ {_update_body(triples, graph)} }}")
+
+    def drop_graph(self, graph: str):
+        self.store.update(f"DROP SILENT GRAPH <{graph}>")
+
+    @staticmethod
+    def _term(term) -> dict:
+        if isinstance(term, pyoxigraph.NamedNode):
+            return {'type': 'uri', 'value': term.value}
+        if isinstance(term, pyoxigraph.BlankNode):
+            return {'type': 'bnode', 'value': term.value}
+        value = {'type': 'literal', 'value': term.value}
+        if term.language:
+            value['xml:lang'] = term.language
+        elif term.datatype.value != 'http://www.w3.org/2001/XMLSchema#string':
+            value['datatype'] = term.datatype.value
+        return value
+
+    def query(self, sparql: str) -> Union[dict, str]:
+        result = self.store.query(sparql, use_default_graph_as_union=True)
+        if isinstance(result, pyoxigraph.QuerySolutions):
+            variables = [v.value for v in result.variables]
+            bindings = []
+            for solution in result:
+                binding = {}
+                for name in variables:
+                    term = solution[name]
+                    if term is not None:
+                        binding[name] = self._term(term)
+                bindings.append(binding)
+            return {'head': {'vars': variables}, 'results': {'bindings': bindings}}
+        if isinstance(result, pyoxigraph.QueryBoolean):
+            return {'head': {}, 'boolean': bool(result)}
+        return "\n".join(f"{triple} ." for triple in result)
+
+
+class ReplicatedStore(GraphStore):
+    """プライマリとローカルのレプリカの両方に書き込み、レプリカから読み込むグラフDB
+
+    レプリカの検索に失敗した場合はプライマリから読み込む。
+    """
+
+    def __init__(self, primary: GraphStore, replica: GraphStore):
+        self.primary = primary
+        self.replica = replica
+
+    def insert_batch(self, triples: List[dict], graph: Optional[str] = None):
+        self.primary.insert_batch(triples, graph)
+        self.replica.insert_batch(triples, graph)
+
+    def delete(self, triples: List[dict], graph: Optional[str] = None):
+        self.primary.delete(triples, graph)
+        self.replica.delete(triples, graph)
+
+    def drop_graph(self, graph: str):
+        self.primary.drop_graph(graph)
+        self.replica.drop_graph(graph)
+
+    def query(self, sparql: str) -> Union[dict, str]:
+        try:
+            return self.replica.query(sparql)
+        except Exception as e:
+            logger.warning(f"レプリカの検索に失敗したため、プライマリから検索します: {str(e)}")
+            return self.primary.query(sparql)
+
+
+_stores: Dict[str, GraphStore] = {}
+_stores_lock = threading.Lock()
+
+
+def is_remote(url: str) -> bool:
+    return url.startswith('http://') or url.startswith('https://')
+
+
+def open_store(url: str, query_url: Optional[str] = None) -> GraphStore:
+    """URL に対応するグラフDBを返却する(同じ URL に対しては同じストアを返却する)"""
+    key = f"{url} {query_url or ''}" if is_remote(url) else url
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            return store
+        if is_remote(url):
+            store = RemoteSparqlStore(url, query_url)
+        elif url.startswith('memory:'):
+            store = RdflibStore()
+        elif url.startswith('file://'):
+            path = url[len('file://'):]
+            if pyoxigraph is not None:
+                store = OxigraphStore(path)
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                store = RdflibStore(path)
+        else:
+            raise ValueError(f"対応していないグラフDBのURLです: {url}")
+        _stores[key] = store
+        logger.info(f"open graph store {url=} {type(store).__name__}")
+        return store
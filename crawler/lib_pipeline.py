@@ -0,0 +1,192 @@
+"""ドメイン単位のクローリングのパイプライン処理モジュール.
+
+取得(レスポンスのバイト列の受信)、解析(トリプルの取り出し)、登録(グラフDBへのまとめての登録)
+の3つのステージを、サイズ上限付きのキューでつないで並行に実行する。
+後段が詰まると前段はキューへの追加で待機するため、グラフDBが遅い場合は取得も遅くなり、
+メモリ使用量はキューのサイズで抑えられる。
+読み込みタイムアウトは受信の間隔にしか効かないため、取得全体の制限時間(deadline) を設けて打ち切る。
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# キューの終端を示す値
+_END = object()
+
+
+class DeadlineExceeded(Exception):
+    """パイプラインが制限時間内に完了しなかった"""
+
+
+class StageStats:
+    """ステージ毎の処理件数と時間
+
+    * busy_time: ステージの処理にかかった時間
+    * idle_time: 前段からの入力を待った時間
+    * stall_time: 後段のキューが一杯で待たされた時間(バックプレッシャー)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.bytes = 0
+        self.idle_time = 0.0
+        self.stall_time = 0.0
+        # 後段のキューが一杯で待たされている場合は、待ち始めた時刻
+        self.stalled_since = 0.0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return max(self.finished_at - self.started_at, 0.0)
+
+    @property
+    def busy_time(self) -> float:
+        return max(self.elapsed - self.idle_time - self.stall_time, 0.0)
+
+    def as_dict(self) -> Dict:
+        elapsed = self.elapsed
+        return {
+            'items': self.items,
+            'bytes': self.bytes,
+            'elapsed': round(elapsed, 3),
+            'busy_time': round(self.busy_time, 3),
+            'idle_time': round(self.idle_time, 3),
+            'stall_time': round(self.stall_time, 3),
+            'items_per_sec': round(self.items / elapsed, 1) if elapsed > 0 else None,
+        }
+
+
+class DomainPipeline:
+    """取得 → 解析 → 登録 のパイプライン
+
+    * source: レスポンスのバイト列(チャンク)を返却するイテラブル
+    * parse: チャンクのイテレータを受け取り、トリプルを一つずつ返却する関数
+    * on_triple: 解析したトリプル毎に呼び出す関数(解析ステージで実行する)
+    * sink: まとめたトリプルのリストを登録する関数(登録ステージで実行する)
+    * deadline: 取得ステージの受信時間(後段が詰まって待たされた時間を除く) の上限秒数(None の場合は打ち切らない)
+    """
+
+    def __init__(
+            self,
+            source: Iterable[bytes],
+            parse: Callable[[Iterator[bytes]], Iterable[dict]],
+            on_triple: Callable[[dict], None],
+            sink: Callable[[List[dict]], None],
+            batch_size: int = 500,
+            queue_size: int = 16,
+            deadline: Optional[float] = None):
+        self.source = source
+        self.parse = parse
+        self.on_triple = on_triple
+        self.sink = sink
+        self.batch_size = batch_size
+        self.deadline = deadline
+        self.chunks = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.stats = {name: StageStats(name) for name in ('fetch', 'parse', 'insert')}
+        self.errors = []
+        self._abort = threading.Event()
+
+    def _check_deadline(self):
+        fetch = self.stats['fetch']
+        if not self.deadline or not fetch.started_at or fetch.finished_at:
+            return
+        # グラフDBが遅いことによる待ちは、航路運営者の遅さとしては数えない
+        now = time.monotonic()
+        stall_time = fetch.stall_time + (now - fetch.stalled_since if fetch.stalled_since else 0.0)
+        if now - fetch.started_at - stall_time > self.deadline:
+            raise DeadlineExceeded(f"{self.deadline} 秒以内に受信が完了しませんでした")
+
+    def _put(self, q: queue.Queue, item, stats: StageStats):
+        started = time.monotonic()
+        stats.stalled_since = started
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.stall_time += time.monotonic() - started
+        stats.stalled_since = 0.0
+
+    def _iter_queue(self, q: queue.Queue, stats: StageStats) -> Iterator:
+        while True:
+            started = time.monotonic()
+            item = _END
+            while not self._abort.is_set():
+                try:
+                    item = q.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    # 取得ステージが受信の途中で止まっていても、後段で制限時間を検知する
+                    self._check_deadline()
+                    continue
+            stats.idle_time += time.monotonic() - started
+            if item is _END:
+                return
+            yield item
+
+    def _run_stage(self, name: str, func: Callable[[StageStats], None], output: queue.Queue = None):
+        stats = self.stats[name]
+        stats.started_at = time.monotonic()
+        try:
+            func(stats)
+        except Exception as e:
+            logger.error(f"パイプラインの {name} ステージでエラーが発生しました: {str(e)}")
+            self.errors.append(e)
+            self._abort.set()
+        finally:
+            stats.finished_at = time.monotonic()
+            if output is not None:
+                self._put(output, _END, stats)
+
+    def _fetch(self, stats: StageStats):
+        for chunk in self.source:
+            if self._abort.is_set():
+                return
+            self._check_deadline()
+            stats.items += 1
+            stats.bytes += len(chunk)
+            self._put(self.chunks, chunk, stats)
+
+    def _parse(self, stats: StageStats):
+        batch = []
+        for triple in self.parse(self._iter_queue(self.chunks, stats)):
+            stats.items += 1
+            self.on_triple(triple)
+            batch.append(triple)
+            if len(batch) >= self.batch_size:
+                self._put(self.batches, batch, stats)
+                batch = []
+        if batch:
+            self._put(self.batches, batch, stats)
+
+    def _insert(self, stats: StageStats):
+        for batch in self._iter_queue(self.batches, stats):
+            self.sink(batch)
+            stats.items += len(batch)
+
+    def run(self) -> Dict[str, Dict]:
+        """パイプラインを実行し、ステージ毎の統計を返却する(いずれかのステージのエラーは送出する)"""
+        threads = [
+            threading.Thread(target=self._run_stage, args=('fetch', self._fetch, self.chunks), daemon=True),
+            threading.Thread(target=self._run_stage, args=('parse', self._parse, self.batches), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        self._run_stage('insert', self._insert)
+        for thread in threads:
+            # 制限時間を超えた場合、取得ステージは受信の途中で止まっていることがあるため待たない
+            # (呼び出し元が応答を閉じると、次の受信で終了する)
+            if not any(isinstance(e, DeadlineExceeded) for e in self.errors):
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
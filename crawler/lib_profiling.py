@@ -0,0 +1,406 @@
+"""クロール周期のプロファイリングと処理時間の内訳モジュール.
+
+* CycleProfiler: 管理APIから予約し、次のクロール周期(またはドメイン) の実行中のみプロファイラと tracemalloc を動かして、
+  結果を {出力先}/{クロール周期ID}/ に書き出す
+* StageTimings: クロール周期毎のステージ(スケジューラ待ち、取得、解析、登録、パブリッシュ) の処理時間を常に記録する
+
+プロファイラは以下から選択する。
+* sampling: 全スレッドのスタックを一定間隔で記録する(パイプラインの取得・解析ステージのスレッドも含む)。
+  結果は flamegraph.pl / speedscope で読み込める collapsed stack 形式と、関数毎の集計で書き出す
+* cprofile: cProfile で関数呼び出しを全て記録する(クロールを実行するスレッドのみ)。
+  結果は pstats で読み込める .prof と、累積時間の上位の関数で書き出す
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('sampling', 'cprofile')
+SCOPE_CYCLE = 'cycle'
+SCOPE_DOMAIN = 'domain'
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime(DATETIME_FORMAT)
+
+
+def _max_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StackSampler:
+    """全スレッドのスタックを interval 秒毎に記録するサンプリングプロファイラ"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str, top: int):
+        """collapsed stack 形式(.folded) と、関数毎のサンプル数(.txt) を書き出す"""
+        with open(f"{path}.folded", 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')[1:]
+            if frames:
+                own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        samples = sum(self.stacks.values()) or 1
+        with open(f"{path}.txt", 'w', encoding='utf-8') as f:
+            f.write(f"samples={self.samples} interval={self.interval}\n\n")
+            for title, counter in (('self', own), ('total', total)):
+                f.write(f"# {title}\n")
+                for name, count in counter.most_common(top):
+                    f.write(f"{count:>8} {count / samples * 100:>6.1f}%  {name}\n")
+                f.write("\n")
+
+
+class _Session:
+    """1回分のプロファイリング"""
+
+    def __init__(self, cycle_id: str, target: str, request: Dict, output_dir: str, interval: float, frames: int, top: int):
+        self.cycle_id = cycle_id
+        self.target = target
+        self.request = request
+        self.top = top
+        self.frames = frames
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', target)
+        self.dir = os.path.join(output_dir, cycle_id)
+        self.path = os.path.join(self.dir, name)
+        self.profiler = cProfile.Profile() if request['profiler'] == 'cprofile' else StackSampler(interval)
+        self.tracing = False
+        self.start_snapshot = None
+        self.started_at = _now()
+        self.started = time.monotonic()
+        self.rss_before = _max_rss_kb()
+
+    def start(self):
+        if self.request['tracemalloc']:
+            # 既に別の処理が tracemalloc を動かしている場合は止めない
+            self.tracing = not tracemalloc.is_tracing()
+            if self.tracing:
+                tracemalloc.start(self.frames)
+            tracemalloc.reset_peak()
+            self.start_snapshot = tracemalloc.take_snapshot()
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self) -> Dict:
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        elapsed = time.monotonic() - self.started
+        os.makedirs(self.dir, exist_ok=True)
+        files = []
+
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.dump_stats(f"{self.path}.prof")
+            text = io.StringIO()
+            pstats.Stats(self.profiler, stream=text).sort_stats('cumulative').print_stats(self.top)
+            with open(f"{self.path}.txt", 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+            files += [f"{self.path}.prof", f"{self.path}.txt"]
+        else:
+            self.profiler.write(self.path, self.top)
+            files += [f"{self.path}.folded", f"{self.path}.txt"]
+
+        memory = None
+        if self.start_snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if self.tracing:
+                tracemalloc.stop()
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            key = 'traceback' if self.frames > 1 else 'lineno'
+            diff = snapshot.filter_traces(filters).compare_to(self.start_snapshot.filter_traces(filters), key)
+            with open(f"{self.path}-alloc.txt", 'w', encoding='utf-8') as f:
+                f.write(f"current={current} peak={peak}\n\n")
+                f.write(f"# プロファイリング中に増加したメモリの上位 {self.top} 件\n")
+                for stat in diff[:self.top]:
+                    f.write(f"{stat}\n")
+                    if key == 'traceback':
+                        for line in stat.traceback.format():
+                            f.write(f"    {line}\n")
+            files.append(f"{self.path}-alloc.txt")
+            memory = {'current': current, 'peak': peak}
+
+        report = {
+            'cycle_id': self.cycle_id,
+            'target': self.target,
+            'profiler': self.request['profiler'],
+            'started_at': self.started_at,
+            'elapsed': round(elapsed, 3),
+            'max_rss_kb': {'before': self.rss_before, 'after': _max_rss_kb()},
+            'tracemalloc': memory,
+            'files': [os.path.basename(path) for path in files],
+        }
+        with open(f"{self.path}.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+        logger.info(f"profile {self.cycle_id=} {self.target=} {elapsed=:.3f}")
+        return report
+
+
+class CycleProfiler:
+    """次のクロール周期、または指定したドメインのクロールのプロファイリング
+
+    arm で予約し、crawling_data が cycle、crawl_frontier が domain で囲んだ処理の実行中のみプロファイリングする。
+    予約は1件のみとし、一度プロファイリングすると解除する。
+    分散クローリングでは、ワーカープロセスのドメインのクロールはプロファイリングできない(cycle はコーディネーターのみ)。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.output_dir = 'profiles'
+        self.interval = 0.005
+        self.frames = 10
+        self.top = 30
+        self.armed: Optional[Dict] = None
+        self.running: Optional[_Session] = None
+        self.last_report: Optional[Dict] = None
+
+    def configure(self, output_dir: str, interval: float, frames: int, top: int):
+        """設定値を更新する(設定ファイルの再読み込み時に呼び出す)"""
+        with self.lock:
+            self.output_dir = output_dir
+            self.interval = interval
+            self.frames = frames
+            self.top = top
+
+    def arm(self, scope: str = SCOPE_CYCLE, domain: Optional[str] = None,
+            profiler: str = 'sampling', trace_memory: bool = True) -> Dict:
+        """プロファイリングを予約する(ValueError: 指定が不正)"""
+        if scope not in (SCOPE_CYCLE, SCOPE_DOMAIN):
+            raise ValueError(f"scope は {SCOPE_CYCLE} / {SCOPE_DOMAIN} のいずれかを指定してください")
+        if scope == SCOPE_DOMAIN and not domain:
+            raise ValueError("scope が domain の場合は domain を指定してください")
+        if profiler not in PROFILERS:
+            raise ValueError(f"profiler は {' / '.join(PROFILERS)} のいずれかを指定してください")
+        with self.lock:
+            self.armed = {
+                'scope': scope, 'domain': domain if scope == SCOPE_DOMAIN else None,
+                'profiler': profiler, 'tracemalloc': trace_memory, 'armed_at': _now()}
+            return dict(self.armed)
+
+    def disarm(self) -> Optional[Dict]:
+        with self.lock:
+            armed, self.armed = self.armed, None
+            return armed
+
+    def _take(self, scope: str, domain: Optional[str] = None) -> Optional[Dict]:
+        with self.lock:
+            armed = self.armed
+            if armed is None or self.running is not None or armed['scope'] != scope:
+                return None
+            if scope == SCOPE_DOMAIN and armed['domain'] != domain:
+                return None
+            self.armed = None
+            return armed
+
+    @contextmanager
+    def _profile(self, request: Optional[Dict], cycle_id: str, target: str):
+        if request is None:
+            yield
+            return
+        session = _Session(cycle_id, target, request, self.output_dir, self.interval, self.frames, self.top)
+        with self.lock:
+            self.running = session
+        try:
+            session.start()
+        except Exception as e:
+            logger.error(f"プロファイリングを開始できませんでした: {str(e)}")
+            with self.lock:
+                self.running = None
+            yield
+            return
+        try:
+            yield
+        finally:
+            try:
+                report = session.stop()
+            except Exception as e:
+                logger.error(f"プロファイリングの結果を書き出せませんでした: {str(e)}")
+                report = None
+            with self.lock:
+                self.running = None
+                if report is not None:
+                    self.last_report = report
+
+    def cycle(self, cycle_id: str):
+        """クロール周期を囲み、予約されていればプロファイリングする"""
+        return self._profile(self._take(SCOPE_CYCLE), cycle_id, SCOPE_CYCLE)
+
+    def domain(self, cycle_id: str, domain: str):
+        """ドメインのクロールを囲み、予約されていればプロファイリングする"""
+        return self._profile(self._take(SCOPE_DOMAIN, domain), cycle_id, domain)
+
+    def get_state(self) -> Dict:
+        with self.lock:
+            running = self.running
+            return {
+                'armed': dict(self.armed) if self.armed else None,
+                'running': {'cycle_id': running.cycle_id, 'target': running.target,
+                            'started_at': running.started_at} if running else None,
+                'last_report': self.last_report,
+            }
+
+    def list_reports(self) -> Dict[str, List[Dict]]:
+        """クロール周期ID毎のプロファイリング結果"""
+        reports: Dict[str, List[Dict]] = {}
+        if not os.path.isdir(self.output_dir):
+            return reports
+        for cycle_id in sorted(os.listdir(self.output_dir)):
+            path = os.path.join(self.output_dir, cycle_id)
+            if not os.path.isdir(path):
+                continue
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.json'):
+                    with open(os.path.join(path, name), 'r', encoding='utf-8') as f:
+                        reports.setdefault(cycle_id, []).append(json.load(f))
+        return reports
+
+
+class StageTimings:
+    """クロール周期毎のステージの処理時間(秒)
+
+    * scheduler_wait: 前回のクロール周期の終了から、エンドポイントが追加されるまで待機した時間
+    * fetch / parse / insert: ドメイン毎のパイプラインの各ステージの処理時間(入力待ち・出力待ちを除く) の合計
+    * publish: クロール完了の通知にかかった時間
+
+    直近 history 件のクロール周期と、起動からの合計を保持する。
+    分散クローリング(CRAWL_SHARDS > 1) のワーカープロセスでクロールしたドメインの fetch / parse / insert は、
+    ワーカープロセス側で記録されるため含まれない。
+    """
+
+    STAGES = ('scheduler_wait', 'fetch', 'parse', 'insert', 'publish')
+
+    def __init__(self, history: int = 20):
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=history)
+        self.totals = dict.fromkeys(self.STAGES, 0.0)
+        self.cycles = 0
+        self.current: Optional[Dict] = None
+        self._started = 0.0
+
+    def configure(self, history: int):
+        with self.lock:
+            if self.recent.maxlen != history:
+                self.recent = deque(self.recent, maxlen=history)
+
+    def begin(self, scheduler_wait: float):
+        """クロール周期の開始(スケジューラの待ち時間を記録する)
+
+        前回のクロール周期がエラーで終了していない場合は、ここで終了する。
+        """
+        with self.lock:
+            self._end()
+            self._started = time.monotonic()
+            self.current = {
+                'cycle_id': None, 'started_at': _now(), 'elapsed': None, 'domains': 0,
+                'stages': dict.fromkeys(self.STAGES, 0.0)}
+            self._add('scheduler_wait', scheduler_wait)
+
+    def set_cycle_id(self, cycle_id: str):
+        with self.lock:
+            if self.current is not None:
+                self.current['cycle_id'] = cycle_id
+
+    def _add(self, stage: str, seconds: float):
+        self.totals[stage] += seconds
+        if self.current is not None:
+            self.current['stages'][stage] += seconds
+
+    def add(self, stage: str, seconds: float):
+        with self.lock:
+            self._add(stage, seconds)
+
+    def add_pipeline(self, stats: Dict[str, Dict]):
+        """DomainPipeline.run の統計から、取得・解析・登録の処理時間を記録する"""
+        with self.lock:
+            for stage in ('fetch', 'parse', 'insert'):
+                self._add(stage, stats[stage]['busy_time'])
+            if self.current is not None:
+                self.current['domains'] += 1
+
+    def _end(self):
+        if self.current is None:
+            return
+        self.current['elapsed'] = round(time.monotonic() - self._started, 3)
+        self.current['stages'] = {k: round(v, 3) for k, v in self.current['stages'].items()}
+        self.recent.append(self.current)
+        self.current = None
+        self.cycles += 1
+
+    def end(self):
+        """クロール周期の終了"""
+        with self.lock:
+            self._end()
+
+    def get(self) -> Dict:
+        with self.lock:
+            current = None
+            if self.current is not None:
+                current = dict(self.current, stages={k: round(v, 3) for k, v in self.current['stages'].items()})
+            return {
+                'cycles': self.cycles,
+                'totals': {k: round(v, 3) for k, v in self.totals.items()},
+                'current': current,
+                'recent': list(self.recent),
+            }
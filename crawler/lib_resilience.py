@@ -0,0 +1,185 @@
+"""航路運営者エンドポイントへのリクエスト制御モジュール.
+
+ホスト単位のレート制限(トークンバケット)、接続・読み込みタイムアウト、
+ドメイン単位のサーキットブレーカーを提供する。
+"""
+import logging
+import threading
+import time
+import urllib.parse
+from typing import Dict, Optional, Tuple
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """サーキットブレーカーが開いているためリクエストを送信しなかった"""
+
+
+class TokenBucket:
+    """トークンバケットによるレート制限"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """トークンを一つ取得する。トークンがなければ補充されるまで待機する"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """失敗が続くドメインへのリクエストを遮断するサーキットブレーカー
+
+    * closed: 通常状態。連続で failure_threshold 回失敗すると open に遷移する
+    * open: リクエストを遮断する。reset_timeout 秒経過すると half_open に遷移する
+    * half_open: 試行リクエストを一つだけ通し、成功すれば closed、失敗すれば open に戻る
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class OperatorClient:
+    """航路運営者エンドポイントへのHTTPクライアント
+
+    同一プロセス内のクローリングで共有し、ホスト毎の状態をクロール周期を跨いで保持する。
+    """
+
+    def __init__(
+            self,
+            rate: float = 5.0,
+            burst: float = 10.0,
+            connect_timeout: float = 5.0,
+            read_timeout: float = 60.0,
+            failure_threshold: int = 3,
+            reset_timeout: float = 300.0):
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.lock = threading.Lock()
+        self.configure(rate, burst, connect_timeout, read_timeout, failure_threshold, reset_timeout)
+
+    def configure(
+            self,
+            rate: float,
+            burst: float,
+            connect_timeout: float,
+            read_timeout: float,
+            failure_threshold: int,
+            reset_timeout: float):
+        """設定値を更新する(設定ファイルの再読み込み時に呼び出す)"""
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+            self.failure_threshold = failure_threshold
+            self.reset_timeout = reset_timeout
+            for bucket in self.buckets.values():
+                bucket.rate, bucket.capacity = rate, burst
+            for breaker in self.breakers.values():
+                breaker.failure_threshold, breaker.reset_timeout = failure_threshold, reset_timeout
+
+    def _get_bucket(self, host: str) -> TokenBucket:
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def get_breaker(self, domain: str) -> CircuitBreaker:
+        with self.lock:
+            if domain not in self.breakers:
+                self.breakers[domain] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[domain]
+
+    def request(self, method: str, url: str, domain: Optional[str] = None, **kwargs) -> requests.Response:
+        """レート制限・タイムアウト・サーキットブレーカーを適用してリクエストを送信する
+
+        通信エラーおよび 5xx 応答はドメインの失敗として記録する。
+        サーキットが開いている場合は CircuitOpenError を送出する。
+        stream=True の場合は本文の受信中にも失敗し得るため、成功は記録しない
+        (呼び出し元が本文を受信し終えてから report_success / report_failure で記録する)。
+        """
+        host = urllib.parse.urlparse(url).netloc
+        breaker = self.get_breaker(domain or host)
+        if not breaker.allow():
+            raise CircuitOpenError(f"サーキットブレーカーが開いています: {domain or host}")
+        self._get_bucket(host).acquire()
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        elif not kwargs.get('stream'):
+            breaker.record_success()
+        return response
+
+    def report_success(self, domain: str):
+        """stream=True のリクエストの本文を受信し終えた"""
+        self.get_breaker(domain).record_success()
+
+    def report_failure(self, domain: str):
+        """stream=True のリクエストの本文の受信中に失敗した(読み込みのタイムアウト、接続の切断など)"""
+        self.get_breaker(domain).record_failure()
+
+    def get(self, url: str, domain: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request('GET', url, domain, **kwargs)
+
+    def post(self, url: str, domain: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request('POST', url, domain, **kwargs)
@@ -0,0 +1,216 @@
+"""クローリングのシャーディング(ドメイン単位の分散クロール) モジュール.
+
+ホワイトリストのドメインをコンシステントハッシュでシャード(ワーカープロセス)
+およびクローラノードに割り当てる。
+コーディネーターは各シャードが発見したドメイン間リンクを集約し、
+そのドメインを担当するシャード、またはノードへ振り分ける。
+"""
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConsistentHashRing:
+    """仮想ノード付きのコンシステントハッシュリング"""
+
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        self.replicas = replicas
+        self._hashes = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def add(self, node: str):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if h in self._nodes:
+                continue
+            bisect.insort(self._hashes, h)
+            self._nodes[h] = node
+
+    def get_node(self, key: str) -> str:
+        """キー(ドメイン名)を担当するノードを返却する"""
+        if not self._hashes:
+            raise ValueError("ハッシュリングにノードが登録されていません")
+        idx = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[self._hashes[idx]]
+
+
+def _init_worker(log_level: int):
+    # spawn されたワーカーはロギング設定を引き継がないため再設定する
+    logging.basicConfig(level=log_level)
+
+
+class ShardedCrawler:
+    """ドメインをシャード(ワーカープロセス)とノードに分散してクロールするコーディネーター
+
+    crawl_func(endpoint, *args) は 1 ドメイン分のクロールを行い、
+    発見したクロール対象のエンドポイント一覧を返却する関数とする。
+    同じドメインは常に同じシャードで処理されるため、
+    ホスト単位の状態(レート制限など)はプロセス内で完結する。
+    """
+
+    def __init__(
+            self,
+            crawl_func: Callable[..., List[str]],
+            domain_func: Callable[[str], str],
+            shard_count: int = 1,
+            nodes: Optional[List[str]] = None,
+            self_node: Optional[str] = None,
+            forward_interval: int = 3600):
+        self.crawl_func = crawl_func
+        self.domain_func = domain_func
+        self.shard_count = max(1, shard_count)
+        self.shard_ring = ConsistentHashRing([str(i) for i in range(self.shard_count)])
+        self.nodes = [n for n in (nodes or []) if n]
+        self.self_node = self_node
+        self.node_ring = None
+        if self.nodes:
+            if self_node not in self.nodes:
+                raise ValueError(f"CRAWL_NODE_SELF {self_node} が CRAWL_NODES に含まれていません")
+            self.node_ring = ConsistentHashRing(self.nodes)
+        # 他ノードへ転送したドメインと転送日時(ノード間での転送の往復を抑止する)
+        self.forward_interval = forward_interval
+        self._forwarded: Dict[str, float] = {}
+        self._executors: List[ProcessPoolExecutor] = []
+        self.lock = threading.Lock()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Flask などのスレッドが動いているプロセスから fork しないよう spawn を使う
+        ctx = multiprocessing.get_context("spawn")
+        level = logging.getLogger().getEffectiveLevel()
+        return ProcessPoolExecutor(
+            max_workers=1, mp_context=ctx,
+            initializer=_init_worker, initargs=(level,))
+
+    def _get_executors(self) -> List[ProcessPoolExecutor]:
+        if not self._executors:
+            self._executors = [self._new_executor() for _ in range(self.shard_count)]
+        return self._executors
+
+    def _replace_executor(self, shard: int, broken: ProcessPoolExecutor):
+        """ワーカープロセスが異常終了して使えなくなったシャードの executor を作り直す"""
+        if self._executors[shard] is not broken:
+            # 同じ executor の他のタスクの失敗で、既に作り直している
+            return
+        logger.error(f"シャード {shard} のワーカープロセスが異常終了したため、作り直します")
+        broken.shutdown(wait=False)
+        self._executors[shard] = self._new_executor()
+
+    def owner_node(self, endpoint: str) -> Optional[str]:
+        """エンドポイントのドメインを担当するノードを返却する(単一ノード構成では None)"""
+        if self.node_ring is None:
+            return None
+        return self.node_ring.get_node(self.domain_func(endpoint))
+
+    def owner_shard(self, endpoint: str) -> int:
+        """エンドポイントのドメインを担当するシャード番号を返却する"""
+        return int(self.shard_ring.get_node(self.domain_func(endpoint)))
+
+    def run(self, endpoint_list: List[str], *args, checkpoint=None) -> List[str]:
+        """エンドポイントリストを起点にクロールし、このノードでクロールしたドメイン一覧を返却する
+
+        checkpoint (CrawlCheckpoint) が指定された場合は、クロール済みのドメインを読み飛ばし、
+        処理中のエンドポイントとクロール済みドメインを記録する。
+        ワーカープロセス内の登録済みトリプル数は記録しないため、再開時はドメインの先頭から登録する。
+        """
+        with self.lock:
+            executors = self._get_executors()
+            crawled = set(checkpoint.completed) if checkpoint is not None else set()
+            remote: Dict[str, List[str]] = {}
+            futures = {}
+            local_domains = []
+
+            def complete(domain: str):
+                local_domains.append(domain)
+                if checkpoint is not None:
+                    checkpoint.complete(domain)
+                    checkpoint.set_frontier([endpoint for endpoint, _, _ in futures.values()])
+                    checkpoint.maybe_save()
+
+            def dispatch(endpoint: str):
+                domain = self.domain_func(endpoint)
+                if domain in crawled:
+                    return
+                crawled.add(domain)
+                node = self.owner_node(endpoint)
+                if node is not None and node != self.self_node:
+                    remote.setdefault(node, []).append(endpoint)
+                    return
+                shard = self.owner_shard(endpoint)
+                logger.info(f"dispatch {endpoint=} {shard=}")
+                executor = executors[shard]
+                try:
+                    future = executor.submit(self.crawl_func, endpoint, *args)
+                except BrokenProcessPool as e:
+                    # 実行中のタスクの結果を受け取る前にワーカープロセスが異常終了していた
+                    logger.error(f"シャードでのクローリングに失敗しました: {endpoint=} {str(e)}")
+                    self._replace_executor(shard, executor)
+                    complete(domain)
+                    return
+                futures[future] = (endpoint, shard, executor)
+
+            for endpoint in endpoint_list:
+                dispatch(endpoint)
+
+            while futures:
+                done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                for future in done:
+                    endpoint, shard, executor = futures.pop(future)
+                    try:
+                        discovered = future.result()
+                    except BrokenProcessPool as e:
+                        logger.error(f"シャードでのクローリングに失敗しました: {endpoint=} {str(e)}")
+                        self._replace_executor(shard, executor)
+                        discovered = []
+                    except Exception as e:
+                        logger.error(f"シャードでのクローリングに失敗しました: {endpoint=} {str(e)}")
+                        discovered = []
+                    for namespace_url in discovered or []:
+                        dispatch(namespace_url)
+                    complete(self.domain_func(endpoint))
+
+            for node, endpoints in remote.items():
+                self.forward(node, endpoints)
+            return local_domains
+
+    def forward(self, node: str, endpoint_list: List[str]):
+        """担当ノードの sendEndpointList API へエンドポイントを転送する"""
+        now = time.time()
+        endpoint_list = [
+            e for e in endpoint_list
+            if now - self._forwarded.get(self.domain_func(e), 0) >= self.forward_interval]
+        if not endpoint_list:
+            return
+        url = f"http://{node}/v1/api/sendEndpointList"
+        try:
+            response = requests.post(url, json={"endpoint_list": endpoint_list, "priority": "background"}, timeout=10)
+            if response.status_code != 200:
+                logger.error(f"ノード {node} へのエンドポイント転送に失敗しました: {response.status_code} {response.text}")
+                return
+        except requests.exceptions.RequestException as e:
+            logger.error(f"ノード {node} へ到達できませんでした: {str(e)}")
+            return
+        for e in endpoint_list:
+            self._forwarded[self.domain_func(e)] = now
+        logger.info(f"forward {node=} {endpoint_list=}")
+
+    def shutdown(self):
+        for executor in self._executors:
+            executor.shutdown(wait=True)
+        self._executors = []
@@ -0,0 +1,124 @@
+"""同一クエリの同時実行をまとめるモジュール(シングルフライト).
+
+クロール完了の通知を受けた多数のクライアントが同じ SPARQL を同時に発行した場合に、
+グラフDBへのリクエストを1回にまとめ、その結果を同時に待っていたすべてのリクエストへ返却する。
+結果のキャッシュは行わず、実行中のリクエストのみを共有する。
+
+Flask(スレッド) 向けの SingleFlight と、FastAPI(asyncio) 向けの AsyncSingleFlight を提供する。
+"""
+import asyncio
+import logging
+import re
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# 文字列リテラル・IRI、またはコメントと空白の並び
+_TOKEN_RE = re.compile(
+    r'("""(?:[^"\\]|\\.|"(?!""))*"""'
+    r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+    r'|"(?:[^"\\\n]|\\.)*"'
+    r"|'(?:[^'\\\n]|\\.)*'"
+    r'|<[^<>"{}|^`\\\s]*>)'
+    r'|(?:\s|#[^\n]*)+')
+
+
+def normalize_query(query: str) -> str:
+    """SPARQL を正規化する(リテラルと IRI の外側のコメントを除き、空白を1文字にまとめる)"""
+    def replace(m):
+        if m.group(1):
+            return m.group(1)
+        return ' '
+    return _TOKEN_RE.sub(replace, query).strip()
+
+
+class _Stats:
+    def __init__(self):
+        # グラフDBへ転送したリクエスト数と、実行中のリクエストの結果を共有したリクエスト数
+        self.forwarded = 0
+        self.coalesced = 0
+
+    def as_dict(self, in_flight: int) -> Dict:
+        total = self.forwarded + self.coalesced
+        return {
+            'forwarded': self.forwarded,
+            'coalesced': self.coalesced,
+            'in_flight': in_flight,
+            'coalesced_ratio': round(self.coalesced / total, 3) if total else None,
+        }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの処理を同時に実行しない(実行中であれば、その結果を待って返却する)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        self.stats = _Stats()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """func の結果と、他のリクエストの結果を共有したかどうかを返却する(func の例外は共有したすべてのリクエストで送出する)"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.stats.forwarded += 1
+            else:
+                self.stats.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return self.stats.as_dict(len(self.calls))
+
+
+class AsyncSingleFlight:
+    """SingleFlight の asyncio 版
+
+    処理は独立したタスクで実行するため、最初のリクエストが切断されても、結果を待っている他のリクエストには影響しない。
+    """
+
+    def __init__(self):
+        self.calls: Dict[Hashable, asyncio.Task] = {}
+        self.stats = _Stats()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        task = self.calls.get(key)
+        shared = task is not None
+        if shared:
+            self.stats.coalesced += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self.calls.pop(key) if self.calls.get(key) is t else None)
+            self.stats.forwarded += 1
+        return await asyncio.shield(task), shared
+
+    def get_stats(self) -> Dict:
+        return self.stats.as_dict(len(self.calls))
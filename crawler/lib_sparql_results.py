@@ -0,0 +1,398 @@
+"""SPARQL の検索結果のデコードモジュール.
+
+クローラと app_link で共通に使用する。
+JSON は orjson / msgspec がインストールされていれば高速なバックエンドを使い、なければ標準の json を使う。
+JSON 以外に application/sparql-results+xml、text/tab-separated-values、application/n-triples を解析する。
+
+結果は SPARQL JSON と同じ形式({'head': {...}, 'results': {'bindings': [...]}} または {'boolean': ...})
+で返却する。
+"""
+import codecs
+import itertools
+import json
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+logger = logging.getLogger(__name__)
+
+JSON = "json"
+XML = "xml"
+TSV = "tsv"
+NTRIPLES = "ntriples"
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+SPARQL_RESULTS_NS = "{http://www.w3.org/2005/sparql-results#}"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+# 航路運営者・グラフDBへの Accept ヘッダー(解析できる形式を JSON 優先で列挙する)
+ACCEPT = ("application/sparql-results+json, application/sparql-results+xml;q=0.9, "
+          "text/tab-separated-values;q=0.8, application/n-triples;q=0.7")
+
+
+def detect_format(content_type: Optional[str], head: bytes = b"") -> str:
+    """Content-Type から検索結果の形式を判定する(判定できない場合は JSON とする)
+
+    text/plain は SPARQL JSON を返却する航路運営者もあるため、本文の先頭(head) で判定する。
+    """
+    content_type = (content_type or "").split(';')[0].strip().lower()
+    if content_type.endswith('xml'):
+        return XML
+    if content_type in ('text/tab-separated-values', 'text/tsv'):
+        return TSV
+    if content_type == 'application/n-triples':
+        return NTRIPLES
+    if content_type == 'text/plain':
+        head = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+        if head.startswith((b"<?xml", b"<sparql")):
+            return XML
+        if head.startswith((b"<", b"_:", b"#")):
+            return NTRIPLES
+    return JSON
+
+
+def _peek(chunks: Iterable[bytes]) -> Tuple[bytes, Iterator[bytes]]:
+    """最初の空でないチャンクと、それを含めたチャンクのイテレータを返却する"""
+    chunks = iter(chunks)
+    for chunk in chunks:
+        if chunk.strip():
+            return chunk, itertools.chain([chunk], chunks)
+    return b"", iter(())
+
+
+def available_backends() -> List[str]:
+    """利用できる JSON のバックエンド一覧"""
+    backends = [JSON]
+    if orjson is not None:
+        backends.append("orjson")
+    if msgspec is not None:
+        backends.append("msgspec")
+    return backends
+
+
+if msgspec is not None:
+    class Term(msgspec.Struct, omit_defaults=True):
+        """バインディングの値(辞書と同じように参照できる)"""
+        type: str
+        value: str
+        datatype: Optional[str] = None
+        lang: Optional[str] = msgspec.field(default=None, name="xml:lang")
+
+        def _key(self, key: str) -> str:
+            return "lang" if key == "xml:lang" else key
+
+        def __getitem__(self, key: str):
+            value = getattr(self, self._key(key), None) if key in ("type", "value", "datatype", "xml:lang") else None
+            if value is None:
+                raise KeyError(key)
+            return value
+
+        def __contains__(self, key: str) -> bool:
+            return key in ("type", "value", "datatype", "xml:lang") and getattr(self, self._key(key)) is not None
+
+        def get(self, key: str, default=None):
+            try:
+                return self[key]
+            except KeyError:
+                return default
+
+    class _Results(msgspec.Struct):
+        bindings: List[Dict[str, Term]]
+
+    class _SelectResults(msgspec.Struct):
+        results: _Results
+
+
+# ---- JSON ----
+
+_BINDINGS_RE = re.compile(r'"bindings"\s*:\s*\[')
+
+
+def iter_json_bindings(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """SPARQL JSON の結果を受信しながら、bindings の要素を一つずつ返却する(標準の json による逐次解析)"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buf = buf[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        if not started:
+            m = _BINDINGS_RE.search(buf)
+            if m is None:
+                continue
+            pos = m.end()
+            started = True
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == ']':
+                return
+            try:
+                binding, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # 要素の途中までしか受信していないため、続きを待つ
+                break
+            yield binding
+    raise ValueError("SPARQL JSON の結果ではないか、結果が途中で終了しています")
+
+
+# ---- XML ----
+
+def _xml_term(element) -> dict:
+    tag = element.tag[len(SPARQL_RESULTS_NS):]
+    if tag == 'uri':
+        return {'type': 'uri', 'value': element.text or ''}
+    if tag == 'bnode':
+        return {'type': 'bnode', 'value': element.text or ''}
+    term = {'type': 'literal', 'value': element.text or ''}
+    if element.get(XML_LANG):
+        term['xml:lang'] = element.get(XML_LANG)
+    elif element.get('datatype'):
+        term['datatype'] = element.get('datatype')
+    return term
+
+
+def _xml_binding(result) -> dict:
+    return {b.get('name'): _xml_term(b[0]) for b in result if len(b)}
+
+
+def iter_xml_bindings(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """SPARQL XML の結果を受信しながら、result 要素を一つずつ返却する"""
+    parser = ET.XMLPullParser(events=('end',))
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                if element.tag == f"{SPARQL_RESULTS_NS}result":
+                    yield _xml_binding(element)
+                    element.clear()
+        parser.close()
+    except ET.ParseError as e:
+        raise ValueError(f"SPARQL XML の結果を解析できませんでした: {str(e)}")
+
+
+def decode_xml(body: bytes) -> dict:
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError as e:
+        raise ValueError(f"SPARQL XML の結果を解析できませんでした: {str(e)}")
+    variables = [v.get('name') for v in root.iter(f"{SPARQL_RESULTS_NS}variable")]
+    boolean = root.find(f"{SPARQL_RESULTS_NS}boolean")
+    if boolean is not None:
+        return {'head': {}, 'boolean': boolean.text.strip() == 'true'}
+    bindings = [_xml_binding(r) for r in root.iter(f"{SPARQL_RESULTS_NS}result")]
+    return {'head': {'vars': variables}, 'results': {'bindings': bindings}}
+
+
+# ---- TSV / N-Triples ----
+
+_TERM_RE = re.compile(
+    r'<([^>]*)>'
+    r'|_:(\S+)'
+    r'|"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<([^>]*)>)?'
+    r'|([^\s"<]+)')
+_ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+_ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+def _unescape(value: str) -> str:
+    if '\\' not in value:
+        return value
+
+    def replace(m):
+        s = m.group(1)
+        if s[0] in 'uU':
+            return chr(int(s[1:], 16))
+        return _ESCAPES.get(s, s)
+    return _ESCAPE_RE.sub(replace, value)
+
+
+def _bare_term(token: str) -> dict:
+    # TSV では数値と真偽値は Turtle の省略形で記述される
+    if token in ('true', 'false'):
+        datatype = 'boolean'
+    elif re.fullmatch(r'[+-]?\d+', token):
+        datatype = 'integer'
+    elif re.fullmatch(r'[+-]?\d*\.\d+', token):
+        datatype = 'decimal'
+    else:
+        datatype = 'double'
+    return {'type': 'literal', 'value': token, 'datatype': XSD + datatype}
+
+
+def _parse_terms(text: str) -> List[Optional[dict]]:
+    terms = []
+    for m in _TERM_RE.finditer(text):
+        iri, bnode, literal, lang, datatype, bare = m.groups()
+        if iri is not None:
+            terms.append({'type': 'uri', 'value': _unescape(iri)})
+        elif bnode is not None:
+            terms.append({'type': 'bnode', 'value': bnode})
+        elif literal is not None:
+            term = {'type': 'literal', 'value': _unescape(literal)}
+            if lang:
+                term['xml:lang'] = lang
+            elif datatype:
+                term['datatype'] = datatype
+            terms.append(term)
+        elif bare != '.':
+            terms.append(_bare_term(bare))
+    return terms
+
+
+def _iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    rest = ''
+    for chunk in chunks:
+        lines = (rest + text_decoder.decode(chunk)).split('\n')
+        rest = lines.pop()
+        yield from lines
+    rest += text_decoder.decode(b'', final=True)
+    if rest:
+        yield rest
+
+
+def iter_tsv_bindings(chunks: Iterable[bytes], variables: Optional[List[str]] = None) -> Iterator[dict]:
+    """SPARQL TSV の結果を受信しながら、行を一つずつ返却する(variables にヘッダーの変数名を格納する)"""
+    lines = _iter_lines(chunks)
+    header = next(lines, '')
+    names = [v.strip().lstrip('?$') for v in header.rstrip('\r').split('\t')]
+    if variables is not None:
+        variables.extend(names)
+    for line in lines:
+        line = line.rstrip('\r')
+        if not line:
+            continue
+        binding = {}
+        for name, cell in zip(names, line.split('\t')):
+            terms = _parse_terms(cell)
+            if terms:
+                binding[name] = terms[0]
+        yield binding
+
+
+def iter_ntriples_bindings(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """N-Triples を受信しながら、トリプルを ?s ?p ?o のバインディングとして一つずつ返却する"""
+    for line in _iter_lines(chunks):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        terms = _parse_terms(line)
+        if len(terms) < 3:
+            raise ValueError(f"N-Triples の行を解析できませんでした: {line}")
+        yield {'s': terms[0], 'p': terms[1], 'o': terms[2]}
+
+
+class SparqlResultsDecoder:
+    """SPARQL の検索結果のデコーダー
+
+    backend には auto / orjson / msgspec / json を指定する。
+    auto の場合は msgspec、orjson、json の順にインストールされているものを使う。
+    指定したバックエンドがインストールされていない場合は json を使う。
+
+    iter_bindings は受信しながらバインディングを返却する。
+    auto の場合、JSON は標準の json で逐次解析し、高速なバックエンドは decode のみで使う
+    (一括解析は受信し終えるまでバインディングを返却できず、取得と登録が並行に進まないうえ、
+    bench_sparql_results.py では逐次解析の方が高速なため)。
+    高速なバックエンドを指定した場合は、受信したデータが max_buffer バイトに収まれば一括で解析し、
+    超えた場合は標準の json による逐次解析に切り替えてメモリ使用量を抑える。
+    """
+
+    def __init__(self, backend: str = "auto", max_buffer: int = 64 * 1024 * 1024):
+        self.backend = self._select_backend(backend)
+        self.max_buffer = max_buffer
+        self.buffered = backend != "auto" and self.backend != JSON
+
+    @staticmethod
+    def _select_backend(backend: str) -> str:
+        backends = available_backends()
+        if backend == "auto":
+            return backends[-1]
+        if backend not in backends:
+            logger.warning(f"SPARQL の検索結果のデコーダー {backend} がインストールされていないため json を使います")
+            return JSON
+        return backend
+
+    def loads(self, body: bytes):
+        """JSON をバックエンドで辞書にデコードする"""
+        if self.backend == "orjson":
+            return orjson.loads(body)
+        if self.backend == "msgspec":
+            return msgspec.json.decode(body)
+        return json.loads(body)
+
+    def _json_bindings(self, body: bytes) -> List:
+        if self.backend == "msgspec":
+            # 型付きの構造体にデコードする(辞書と同じように参照できる)
+            return msgspec.json.decode(body, type=_SelectResults).results.bindings
+        return self.loads(body)['results']['bindings']
+
+    def decode(self, body: bytes, content_type: Optional[str] = None) -> dict:
+        """検索結果を SPARQL JSON と同じ形式の辞書にデコードする"""
+        fmt = detect_format(content_type, body[:64])
+        if fmt == XML:
+            return decode_xml(body)
+        if fmt == TSV:
+            variables = []
+            bindings = list(iter_tsv_bindings([body], variables))
+            return {'head': {'vars': variables}, 'results': {'bindings': bindings}}
+        if fmt == NTRIPLES:
+            bindings = list(iter_ntriples_bindings([body]))
+            return {'head': {'vars': ['s', 'p', 'o']}, 'results': {'bindings': bindings}}
+        return self.loads(body)
+
+    def iter_bindings(self, chunks: Iterable[bytes], content_type: Optional[str] = None) -> Iterator:
+        """検索結果を受信しながら、バインディングを一つずつ返却する"""
+        head, chunks = _peek(chunks)
+        fmt = detect_format(content_type, head[:64])
+        if fmt == XML:
+            return iter_xml_bindings(chunks)
+        if fmt == TSV:
+            return iter_tsv_bindings(chunks)
+        if fmt == NTRIPLES:
+            return iter_ntriples_bindings(chunks)
+        if not self.buffered:
+            return iter_json_bindings(chunks)
+        return self._iter_json_buffered(chunks)
+
+    def _iter_json_buffered(self, chunks: Iterable[bytes]) -> Iterator:
+        buf = bytearray()
+        chunks = iter(chunks)
+        for chunk in chunks:
+            buf += chunk
+            if len(buf) > self.max_buffer:
+                logger.info(f"SPARQL JSON の結果が {self.max_buffer} バイトを超えたため、逐次解析に切り替えます")
+                yield from iter_json_bindings(itertools.chain([bytes(buf)], chunks))
+                return
+        try:
+            bindings = self._json_bindings(bytes(buf))
+        except Exception as e:
+            raise ValueError(f"SPARQL JSON の結果ではありません: {str(e)}")
+        yield from bindings
+
+
+_decoders: Dict[str, SparqlResultsDecoder] = {}
+
+
+def get_decoder(backend: str = "auto", max_buffer: int = 64 * 1024 * 1024) -> SparqlResultsDecoder:
+    """設定に対応するデコーダーを返却する"""
+    key = f"{backend} {max_buffer}"
+    if key not in _decoders:
+        _decoders[key] = SparqlResultsDecoder(backend, max_buffer)
+    return _decoders[key]
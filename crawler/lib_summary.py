@@ -0,0 +1,149 @@
+"""ドメイン毎の集計(サマリーインデックス) モジュール.
+
+クロールでドメインのトリプルが追加・削除される毎に、以下を差分で更新する。
+
+* トリプル数
+* 述語毎のトリプル数
+* クラス(rdf:type の目的語) 毎のリソース数
+* 他ドメインへのリンク数(目的語の IRI のドメインが異なるトリプル数、rdf:type は除く)
+* 直近に追加されたリソース(rdf:type を持つ主語)
+
+集計は JSON ファイルに保存し、app_link はファイルが更新された場合のみ読み込み直してメモリから返却する。
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import urllib.parse
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from lib_sparql_results import iter_ntriples_bindings
+
+
+logger = logging.getLogger(__name__)
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+
+def _iter_triples(lines: Iterable[str]) -> Iterator[dict]:
+    return iter_ntriples_bindings(f"{line}\n".encode('utf-8') for line in lines)
+
+
+def _new_summary() -> Dict:
+    return {'triples': 0, 'predicates': {}, 'classes': {}, 'links': {}, 'latest': [], 'updated_at': None}
+
+
+class SummaryIndex:
+    """ドメイン毎の集計
+
+    apply は ChangeLog のリスナーとして登録し、ドメインの差分を記録する毎に呼び出す。
+    集計にないドメインは、スナップショットの全トリプルから集計し直す。
+    """
+
+    def __init__(self, path: str, latest_size: int = 20):
+        self.path = path
+        self.latest_size = latest_size
+        self.lock = threading.Lock()
+        self._cache: Optional[Tuple[float, Dict]] = None
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {'domains': {}}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, data: Dict):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, summary: Dict, domain: str, triples: Iterable[dict], sign: int, timestamp: str):
+        predicates = Counter()
+        classes = Counter()
+        links = Counter()
+        typed = []
+        count = 0
+        for triple in triples:
+            count += 1
+            predicate = triple['p']['value']
+            predicates[predicate] += 1
+            if triple['o']['type'] != 'uri':
+                continue
+            if predicate == RDF_TYPE:
+                classes[triple['o']['value']] += 1
+                typed.append(triple['s']['value'])
+                continue
+            target = urllib.parse.urlparse(triple['o']['value']).netloc
+            if target and target != domain:
+                links[target] += 1
+
+        summary['triples'] += sign * count
+        for key, counter in (('predicates', predicates), ('classes', classes), ('links', links)):
+            values = summary[key]
+            for name, n in counter.items():
+                values[name] = values.get(name, 0) + sign * n
+                if values[name] <= 0:
+                    del values[name]
+
+        # 直近に追加されたリソース(削除されたリソースは除く)
+        typed = list(dict.fromkeys(typed))
+        if sign > 0:
+            resources = {r['resource'] for r in summary['latest']}
+            added = [{'resource': s, 'timestamp': timestamp} for s in reversed(typed) if s not in resources]
+            summary['latest'] = (added + summary['latest'])[:self.latest_size]
+        else:
+            removed = set(typed)
+            summary['latest'] = [r for r in summary['latest'] if r['resource'] not in removed]
+
+    def apply(self, domain: str, snapshot_path: str, added: Iterator[str], removed: List[str], timestamp: str):
+        """ドメインの差分を集計へ反映する"""
+        with self.lock, open(f"{self.path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data = self._read()
+            summary = data['domains'].get(domain)
+            if summary is None:
+                summary = _new_summary()
+                with open(snapshot_path, 'r', encoding='utf-8') as f:
+                    self._update(summary, domain, _iter_triples(line.rstrip('\n') for line in f), 1, timestamp)
+            else:
+                self._update(summary, domain, _iter_triples(removed), -1, timestamp)
+                self._update(summary, domain, _iter_triples(added), 1, timestamp)
+            summary['updated_at'] = timestamp
+            data['domains'][domain] = summary
+            self._write(data)
+        logger.info(f"summary {domain=} {summary['triples']=}")
+
+    def get(self) -> Dict:
+        """集計を返却する(ファイルが更新されていなければ前回読み込んだ内容を返却する)"""
+        if not os.path.exists(self.path):
+            return {'domains': {}}
+        mtime = os.path.getmtime(self.path)
+        cache = self._cache
+        if cache is None or cache[0] != mtime:
+            cache = self._cache = (mtime, self._read())
+        return cache[1]
+
+    def overview(self) -> Dict[str, Dict]:
+        """ドメイン毎のトリプル数、クラス数、リンク先ドメイン数"""
+        return {
+            domain: {
+                'triples': summary['triples'],
+                'predicates': len(summary['predicates']),
+                'classes': len(summary['classes']),
+                'linked_domains': len(summary['links']),
+                'updated_at': summary['updated_at'],
+            }
+            for domain, summary in self.get()['domains'].items()}
+
+    def domain(self, domain: str) -> Optional[Dict]:
+        return self.get()['domains'].get(domain)
+
+    def links(self) -> List[Dict]:
+        """ドメイン間のリンクの一覧"""
+        return [
+            {'from': domain, 'to': target, 'triples': n}
+            for domain, summary in self.get()['domains'].items()
+            for target, n in summary['links'].items()]